@@ -2,6 +2,8 @@ import pandas as pd
 import numpy as np
 import os
 
+from aux_functions import write_health_parquet
+
 print('\nSTART\n')
 
 # =============================================================
@@ -75,88 +77,121 @@ df2['IDADEMAE'] = df2['IDADEMAE'].fillna('200').astype(int)
 # Risk score construction
 # =============================================================
 
-def build_risk_score(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+# Risk score components as {code: risk}; codes not listed take the
+# default. The cleaned columns hold string codes ('1', '9'), which are
+# looked up by their integer value.
+
+# ESCMAE — Maternal schooling
+# Lower schooling → higher risk
+ESC_RISK = {
+    1: 1.0,   # none
+    2: 0.8,
+    3: 0.6,
+    4: 0.3,
+    5: 0.1,   # highest schooling
+    9: 1.2    # ignored → penalize
+}
+ESC_DEFAULT = 1.0
+
+# RACACOR / RACACORMAE — Infant and mother's race/color
+RACE_RISK = {
+    1: 0.0,   # white
+    2: 0.3,   # black
+    3: 0.2,   # yellow
+    4: 0.3,   # parda
+    5: 0.4    # indigenous
+}
+RACE_DEFAULT = 0.3
 
-    # ---------------------------------------------------------
-    # ESCMAE — Maternal schooling
-    # Lower schooling → higher risk
-    # ---------------------------------------------------------
-    esc_map = {
-        1: 1.0,   # none
-        2: 0.8,
-        3: 0.6,
-        4: 0.3,
-        5: 0.1,   # highest schooling
-        9: 1.2    # ignored → penalize
-    }
+RISK_SCORE_DTYPE = np.float64   # np.float32 halves the score's memory
+RISK_SCORE_CHUNK = 1_000_000    # rows per chunk (bounds temporaries)
 
-    esc_risk = df['ESCMAE'].map(esc_map).fillna(1.0)
 
-    # ---------------------------------------------------------
-    # IDADEMAE — Maternal age
-    # Safe zone: 18–35
-    # Ignored value: 200
-    # ---------------------------------------------------------
-    idade = df['IDADEMAE']
+def code_risk(codes, risk_map, default):
+    """
+    Risk of each code through array indexing: the column is factorized
+    (a handful of distinct codes) and each distinct code is looked up
+    once in `risk_map` by its numeric value, so '1' and 1 both match.
+    """
+    index, uniques = pd.factorize(codes)
+    unique_codes = pd.to_numeric(pd.Series(uniques), errors='coerce')
+
+    # last slot: missing values (factorize code -1)
+    table = np.append(
+        [risk_map.get(code, default) for code in unique_codes], default
+    )
+    return table[index]
 
-    # initialize with NaN
-    age_risk = np.full(len(df), np.nan)
 
-    # ignored ages
-    age_risk[idade == 200] = 1.5
+def age_risk(idade):
+    """
+    IDADEMAE — Maternal age. Safe zone 18–35, quadratic penalty on the
+    distance from it; the ignored value 200 gets 1.5. Evaluated on the
+    distinct ages of the chunk and then indexed.
+    """
+    lo = idade.min()
+    ages = np.arange(lo, idade.max() + 1)
 
     # distance from safe zone
     dist = np.where(
-        (idade >= 18) & (idade <= 35),
+        (ages >= 18) & (ages <= 35),
         0,
-        np.minimum(np.abs(idade - 18), np.abs(idade - 35))
+        np.minimum(np.abs(ages - 18), np.abs(ages - 35))
     )
 
-    # quadratic penalty
-    computed_age_risk = 0.1 + 0.02 * (dist ** 2)
+    table = np.where(ages == 200, 1.5, 0.1 + 0.02 * (dist ** 2))
+    return table[idade - lo]
 
-    # fill where not ignored
-    age_risk = np.where(np.isnan(age_risk), computed_age_risk, age_risk)
 
-    # ---------------------------------------------------------
-    # RACACOR — Infant race/color
-    # ---------------------------------------------------------
-    race_risk_map = {
-        1: 0.0,   # white
-        2: 0.3,   # black
-        3: 0.2,   # yellow
-        4: 0.3,   # parda
-        5: 0.4    # indigenous
-    }
+def build_risk_score(
+    df: pd.DataFrame,
+    dtype=RISK_SCORE_DTYPE,
+    chunk_size=RISK_SCORE_CHUNK,
+) -> pd.DataFrame:
+    """
+    Add risk_score in [0, 1000] to `df` (in place): weighted sum of the
+    schooling, maternal age and race components, min-max normalized.
 
-    race_inf_risk = df['RACACOR'].map(race_risk_map).fillna(0.3)
+    Rows are processed in chunks, so temporaries are O(chunk_size) and
+    the only full-length array is the score itself, of `dtype`.
+    """
+    n = len(df)
+    score = np.empty(n, dtype=dtype)
 
-    # ---------------------------------------------------------
-    # RACACORMAE — Mother's race/color
-    # ---------------------------------------------------------
-    race_mom_risk = df['RACACORMAE'].map(race_risk_map).fillna(0.3)
+    esc = df['ESCMAE'].to_numpy()
+    idade = df['IDADEMAE'].to_numpy()
+    race_inf = df['RACACOR'].to_numpy()
+    race_mom = df['RACACORMAE'].to_numpy()
 
     # ---------------------------------------------------------
     # Combine components (weighted sum)
     # ---------------------------------------------------------
-    raw_score = (
-        0.40 * esc_risk +
-        0.20 * age_risk +
-        0.20 * race_inf_risk +
-        0.30 * race_mom_risk
-    )
+    for start in range(0, n, chunk_size):
+        rows = slice(start, start + chunk_size)
+
+        score[rows] = (
+            0.40 * code_risk(esc[rows], ESC_RISK, ESC_DEFAULT) +
+            0.20 * age_risk(idade[rows]) +
+            0.20 * code_risk(race_inf[rows], RACE_RISK, RACE_DEFAULT) +
+            0.30 * code_risk(race_mom[rows], RACE_RISK, RACE_DEFAULT)
+        )
 
     # ---------------------------------------------------------
-    # Normalize to [0, 1000]
+    # Normalize to [0, 1000] (in place)
     # ---------------------------------------------------------
-    min_raw = raw_score.min()
-    max_raw = raw_score.max()
+    min_raw = score.min()
+    max_raw = score.max()
 
     if max_raw == min_raw:
         df['risk_score'] = 500
     else:
-        df['risk_score'] = 1000 * (raw_score - min_raw) / (max_raw - min_raw)
+        for start in range(0, n, chunk_size):
+            rows = slice(start, start + chunk_size)
+            score[rows] -= min_raw
+            score[rows] *= 1000
+            score[rows] /= max_raw - min_raw
+
+        df['risk_score'] = score
 
     return df
 
@@ -183,6 +218,7 @@ output_path = (
     'births_processed_2010-2022.parquet'
 )
 
-df2.to_parquet(output_path, index=False)
+# Compact schema: int8 codes, int32 municipality, date32 DTNASC
+write_health_parquet(df2, output_path)
 
 print('\nFINISHED\n')
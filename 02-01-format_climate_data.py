@@ -1,6 +1,8 @@
-import os
-import pandas as pd
-from joblib import Parallel, delayed
+from climate_exposure import (
+    flag_heat_events,
+    heat_exposure_table,
+    read_climate_files,
+)
 
 print('\nSTART\n')
 
@@ -12,13 +14,18 @@ DATE_COL = 'date'
 CITY_COL = 'code_muni'
 TEMPERATURE_COL = 'TMAX_max'
 
+# Reading
+N_THREADS = 8
+SAVE_RAW_COPY = False     # full-column BR-DWGD_2010-2024.parquet
+
 # Heat-event parameters
 WINDOW_SIZE = 90          # last trimester
 TEMPERATURE_THRESHOLD = 30
 MIN_DAYS = 30
 
-# Parallelization
-N_JOBS = 12
+# Sensitivity grid (hot-day counts for every threshold x window)
+GRID_THRESHOLDS = [28, 30, 32, 34]
+GRID_WINDOW_SIZES = [30, 60, 90]
 
 
 # =============================================================
@@ -32,22 +39,19 @@ input_folder = (
     'raw_CLIMATERNA_data/climate/'
 )
 
-list_dfs = []
+# Only the columns used downstream, unless the raw copy is kept
+columns = None if SAVE_RAW_COPY else [DATE_COL, CITY_COL, TEMPERATURE_COL]
 
-for filename in os.listdir(input_folder):
-    if filename.endswith('.parquet'):
-        print(filename)
-        df_year = pd.read_parquet(os.path.join(input_folder, filename))
-        list_dfs.append(df_year)
+df = read_climate_files(input_folder, columns, N_THREADS)
 
-df = pd.concat(list_dfs, ignore_index=True)
+if SAVE_RAW_COPY:
+    df.to_parquet(
+        'observational_data/processed_data/'
+        'BR-DWGD_2010-2024.parquet',
+        index=False
+    )
 
-# Save combined raw dataset
-df.to_parquet(
-    'observational_data/processed_data/'
-    'BR-DWGD_2010-2024.parquet',
-    index=False
-)
+    df = df[[DATE_COL, CITY_COL, TEMPERATURE_COL]]
 
 
 # =============================================================
@@ -57,73 +61,49 @@ df.to_parquet(
 print('\nFlag heat event\n')
 
 
-def flag_heat_event(
-    group: pd.DataFrame,
-    window_size: int,
-    temperature_threshold: float,
-    min_days: int,
-    date_col: str,
-    city_col: str,
-    temperature_col: str,
-) -> pd.DataFrame:
-    """
-    Flag heat events based on the number of hot days
-    in a rolling window.
-    """
-    group = group.sort_values(date_col).copy()
-
-    # Daily heat indicator
-    group['heat'] = group[temperature_col] > temperature_threshold
-
-    # Count hot days in the previous window (excluding today)
-    group['n_hot_days_last_X'] = (
-        group['heat']
-        .shift(1)
-        .rolling(window=window_size, min_periods=1)
-        .sum()
-    )
-
-    # Heat-event flag
-    group['heat_event'] = group['n_hot_days_last_X'] >= min_days
-
-    return group[
-        [city_col, date_col, temperature_col, 'heat_event']
-    ]
+# All municipalities in one sorted cumulative-sum pass
+df_final = flag_heat_events(
+    df,
+    WINDOW_SIZE,
+    TEMPERATURE_THRESHOLD,
+    MIN_DAYS,
+    DATE_COL,
+    CITY_COL,
+    TEMPERATURE_COL,
+)
 
 
 # =============================================================
-# Parallel processing by municipality
+# Save processed dataset
 # =============================================================
 
-results = Parallel(
-    n_jobs=N_JOBS,
-    backend='loky',
-    verbose=5
-)(
-    delayed(flag_heat_event)(
-        group,
-        WINDOW_SIZE,
-        TEMPERATURE_THRESHOLD,
-        MIN_DAYS,
-        DATE_COL,
-        CITY_COL,
-        TEMPERATURE_COL,
-    )
-    for _, group in df.groupby(CITY_COL, sort=False)
-)
+print('\nsave\n')
 
-df_final = pd.concat(results, ignore_index=True)
+df_final.to_parquet(
+    'observational_data/processed_data/'
+    'climate_processed_2010-2024.parquet',
+    index=False
+)
 
 
 # =============================================================
-# Save processed dataset
+# Exposure grid for sensitivity analysis
 # =============================================================
 
-print('\nsave\n')
+print('\nExposure grid\n')
 
-df_final.to_parquet(
+df_grid = heat_exposure_table(
+    df,
+    GRID_THRESHOLDS,
+    GRID_WINDOW_SIZES,
+    DATE_COL,
+    CITY_COL,
+    TEMPERATURE_COL,
+)
+
+df_grid.drop(columns=[TEMPERATURE_COL]).to_parquet(
     'observational_data/processed_data/'
-    'climate_processed_2010-2024.parquet',
+    'climate_exposure_grid_2010-2024.parquet',
     index=False
 )
 
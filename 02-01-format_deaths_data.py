@@ -1,8 +1,10 @@
 import os
-from datetime import datetime, timedelta
 
+import numpy as np
 import pandas as pd
 
+from aux_functions import write_health_parquet
+
 print("\nSTART\n")
 
 # ======================================================
@@ -82,43 +84,37 @@ df2["DTOBITO_dt"] = pd.to_datetime(
     df2["DTOBITO"], format="%d%m%Y", errors="coerce"
 )
 
-df2["HORAOBITO_dt"] = (
+# Time of death as an offset from midnight (missing -> 00:00)
+df2["HORAOBITO_delta"] = (
     pd.to_datetime(
         df2["HORAOBITO"].astype(str).str.zfill(4),
         format="%H%M",
         errors="coerce",
     )
-    .dt.time
-    .fillna(datetime.strptime("0000", "%H%M").time())
+    .pipe(lambda t: t - t.dt.normalize())
+    .fillna(pd.Timedelta(0))
 )
 
-df2["OBITO_datetime"] = df2.apply(
-    lambda row: datetime.combine(row["DTOBITO_dt"], row["HORAOBITO_dt"]),
-    axis=1,
-)
+df2["OBITO_datetime"] = df2["DTOBITO_dt"] + df2["HORAOBITO_delta"]
 
 # ======================================================
 # Compute birth datetime from age
 # ======================================================
-df2["IDADE_delta"] = df2.apply(
-    lambda row: (
-        timedelta(minutes=row["IDADE_02"])
-        if row["IDADE_01"] == 0
-        else timedelta(hours=row["IDADE_02"])
-    ),
-    axis=1,
+# IDADE_02 is in minutes (IDADE_01 == 0) or hours (IDADE_01 == 1)
+df2["IDADE_delta"] = pd.to_timedelta(
+    np.where(df2["IDADE_01"] == 0, 1, 60)
+    * df2["IDADE_02"].astype("float64"),
+    unit="m",
 )
 
 df2["DTNASC_calc"] = df2["OBITO_datetime"] - df2["IDADE_delta"]
 
-# Format calculated birth date
-df2["DTNASC_format"] = df2["DTNASC_calc"].dt.strftime("%d%m%Y")
-
 # ======================================================
 # Coalesce original and calculated birth date
 # ======================================================
 df2["DTNASC_fill"] = (
-    df2[["DTNASC", "DTNASC_format"]].bfill(axis=1).iloc[:, 0]
+    pd.to_datetime(df2["DTNASC"], format="%d%m%Y", errors="coerce")
+    .fillna(df2["DTNASC_calc"].dt.normalize())
 )
 
 # ======================================================
@@ -139,6 +135,7 @@ df2 = df2.reset_index(drop=True).reset_index(names="id_sim")
 # Save
 # ======================================================
 print("\nSaving\n")
-df2.to_parquet(OUTPUT_PATH, index=False)
+# Compact schema: int8 codes, int32 municipality, date32 DTNASC
+write_health_parquet(df2, OUTPUT_PATH)
 
 print("\nFINISHED\n")
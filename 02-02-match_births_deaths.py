@@ -1,6 +1,13 @@
-import os
 import pandas as pd
 
+from aux_functions import iter_row_groups, read_health_parquet
+from record_linkage import (
+    blocked_candidate_join,
+    greedy_one_to_one,
+    optimal_one_to_one,
+    probabilistic_candidate_pairs,
+)
+
 print("\nSTART\n")
 
 # ======================================================
@@ -8,6 +15,14 @@ print("\nSTART\n")
 # ======================================================
 YEARS = [2022, 2021, 2020, 2019, 2018]
 
+# "exact": equality on all linkage columns + greedy one-to-one
+# "probabilistic": blocking on (municipality, week of birth),
+#                  Fellegi-Sunter scores + optimal one-to-one
+LINKAGE_MODE = "exact"
+
+# Fields scored in probabilistic mode (birth date is always scored)
+COLUMNS_COMPARE = ["IDADEMAE", "RACACOR", "SEXO"]
+
 # Columns used for linkage
 COLUMNS_JOIN_SIM = [
     "DTNASC",
@@ -40,81 +55,86 @@ SINASC_PATH = (
     "births_processed_2010-2022.parquet"
 )
 
+MATCH_PATH = (
+    "observational_data/processed_data/"
+    "match_birth_death_2018-2022.parquet"
+)
+
 # ======================================================
 # Read deaths (SIM)
 # ======================================================
 print("\nReading files: DEATHS (SIM)\n")
-df_sim = pd.read_parquet(SIM_PATH, engine="fastparquet")
+df_sim = read_health_parquet(SIM_PATH)
 
 df_sim["id_sim"] = df_sim["id_sim"].astype(int)
-df_sim["DTNASC"] = pd.to_datetime(df_sim["DTNASC"], format="%d%m%Y")
 
 print("SIM shape (before year filter):", df_sim.shape)
 df_sim = df_sim.loc[df_sim["DTNASC"].dt.year.isin(YEARS)]
 print("SIM shape (after year filter): ", df_sim.shape)
 
 # ======================================================
-# Read births (SINASC)
+# Read births (SINASC) block by block
 # ======================================================
+# Only the id and linkage keys are read, one row group at a time
 print("\nReading files: BIRTHS (SINASC)\n")
-df_sinasc = pd.read_parquet(SINASC_PATH, engine="fastparquet")
 
-df_sinasc["id_sinasc"] = df_sinasc["id_sinasc"].astype(int)
-df_sinasc["DTNASC"] = pd.to_datetime(df_sinasc["DTNASC"], format="%d%m%Y")
+n_sinasc = {"before": 0, "after": 0}
 
-print("SINASC shape (before year filter):", df_sinasc.shape)
-df_sinasc = df_sinasc.loc[df_sinasc["DTNASC"].dt.year.isin(YEARS)]
-print("SINASC shape (after year filter): ", df_sinasc.shape)
 
-# ======================================================
-# First join: potential matches
-# ======================================================
-df_join = df_sinasc.merge(
-    df_sim,
-    how="left",
-    left_on=COLUMNS_JOIN_SINASC,
-    right_on=COLUMNS_JOIN_SIM,
-    suffixes=("_sinasc", "_sim"),
-)
+def sinasc_blocks():
+    for block in iter_row_groups(
+        SINASC_PATH,
+        columns=["id_sinasc"] + COLUMNS_JOIN_SINASC,
+    ):
+        block["id_sinasc"] = block["id_sinasc"].astype(int)
 
-# ======================================================
-# Aggregate possible matches per death record
-# ======================================================
-df_matches = (
-    df_join
-    .groupby("id_sim")
-    .agg(
-        sinasc_count=("id_sinasc", "count"),
-        sinasc_list=("id_sinasc", lambda x: sorted(x.dropna().tolist())),
-    )
-    .sort_values("id_sim")
-    .reset_index()
-)
+        n_sinasc["before"] += len(block)
+        block = block.loc[block["DTNASC"].dt.year.isin(YEARS)]
+        n_sinasc["after"] += len(block)
+
+        yield block
 
-# ======================================================
-# Greedy one-to-one matching
-# ======================================================
-id_sim_match = []
-id_sinasc_match = []
 
-for _, row in df_matches.iterrows():
-    # available SINASC ids not yet matched
-    available_matches = sorted(
-        set(row["sinasc_list"]) - set(id_sinasc_match)
+if LINKAGE_MODE == "probabilistic":
+    # ==================================================
+    # Scored candidate pairs + optimal assignment
+    # ==================================================
+    df_join = probabilistic_candidate_pairs(
+        sinasc_blocks(),
+        df_sim.rename(columns=COLUMN_RENAME_SIM_TO_SINASC),
+        compare_on=COLUMNS_COMPARE,
+        municipality=COLUMN_RENAME_SIM_TO_SINASC["CODMUNNATU"],
     )
 
-    if not available_matches:
-        continue
+    df_matches_clean = optimal_one_to_one(
+        df_join,
+        left="id_sim",
+        right="id_sinasc",
+    )
+else:
+    # ==================================================
+    # Candidate pairs: SINASC blocks x SIM (inner join)
+    # ==================================================
+    df_join = blocked_candidate_join(
+        sinasc_blocks(),
+        df_sim,
+        left_on=COLUMNS_JOIN_SINASC,
+        right_on=COLUMNS_JOIN_SIM,
+    )
 
-    id_sim_match.append(int(row["id_sim"]))
-    id_sinasc_match.append(available_matches[0])
+    # ==================================================
+    # Greedy one-to-one matching
+    # ==================================================
+    # Deaths in ascending id_sim order each take the smallest
+    # not-yet-matched id_sinasc among their candidates
+    df_matches_clean = greedy_one_to_one(
+        df_join,
+        left="id_sim",
+        right="id_sinasc",
+    )
 
-df_matches_clean = pd.DataFrame(
-    {
-        "id_sim": id_sim_match,
-        "id_sinasc": id_sinasc_match,
-    }
-)
+print("SINASC rows (before year filter):", n_sinasc["before"])
+print("SINASC rows (after year filter): ", n_sinasc["after"])
 
 # ======================================================
 # Diagnostics
@@ -125,7 +145,7 @@ print("id_sim total:        ", df_sim["id_sim"].nunique())
 print("id_sim with any hit: ", df_join["id_sim"].nunique())
 print("id_sim matched:     ", df_matches_clean["id_sim"].nunique())
 
-print("id_sinasc total:    ", df_sinasc["id_sinasc"].nunique())
+print("id_sinasc total:    ", n_sinasc["after"])
 print("id_sinasc matched:  ", df_matches_clean["id_sinasc"].nunique())
 
 # ======================================================
@@ -133,10 +153,6 @@ print("id_sinasc matched:  ", df_matches_clean["id_sinasc"].nunique())
 # ======================================================
 print("\nSave\n")
 
-df_matches_clean.to_parquet(
-    "observational_data/processed_data/"
-    "match_birth_death_2018-2022.parquet",
-    index=False,
-)
+df_matches_clean.to_parquet(MATCH_PATH, index=False)
 
 print("\nFINISHED\n")
@@ -1,6 +1,9 @@
 import numpy as np
 import pandas as pd
 
+from aux_functions import read_health_parquet
+from climate_exposure import exposure_column, select_heat_event
+
 print("\nSTART\n")
 
 # ======================================================
@@ -28,21 +31,43 @@ OUTPUT_PATH = (
     "climate_births_deaths_2018-2022.parquet"
 )
 
+EXPOSURE_GRID_PATH = (
+    PROCESSED_FOLDER+
+    "climate_exposure_grid_2010-2024.parquet"
+)
+
 YEARS = [2022,2021,2020,2019,2018]
 
+# Exposure definition: None uses heat_event from the climate stage,
+# or (temperature threshold, window size, min days) from the grid
+EXPOSURE = None
+
 # ======================================================
 # Read climate data
 # ======================================================
 print("\nReading files: CLIMATE\n")
 
-climate = pd.read_parquet(
-    CLIMATE_PATH,
-    columns=["code_muni", "date", "heat_event"],
-)
+if EXPOSURE is None:
+    climate = pd.read_parquet(
+        CLIMATE_PATH,
+        columns=["code_muni", "date", "heat_event"],
+    )
+else:
+    threshold, window_size, min_days = EXPOSURE
+    count_col = exposure_column(threshold, window_size)
+
+    climate = pd.read_parquet(
+        EXPOSURE_GRID_PATH,
+        columns=["code_muni", "date", count_col],
+    )
+    climate["heat_event"] = select_heat_event(
+        climate, threshold, window_size, min_days
+    )
+    climate = climate.drop(columns=[count_col])
 
 climate["DATA"] = pd.to_datetime(climate["date"])
 climate['YEAR'] = pd.to_datetime(climate['DATA']).dt.year
-climate["CODMUNICIPIO"] = climate["code_muni"].str[:-1]
+climate["CODMUNICIPIO"] = climate["code_muni"].str[:-1].astype("int32")
 
 climate = climate.drop(columns=["date", "code_muni"])
 climate = climate.loc[climate['YEAR'].isin(YEARS)]
@@ -51,7 +76,7 @@ climate = climate.loc[climate['YEAR'].isin(YEARS)]
 # ======================================================
 print("\nReading files: BIRTHS\n")
 
-births = pd.read_parquet(
+births = read_health_parquet(
     BIRTHS_PATH,
     columns=[
         "id_sinasc",
@@ -63,8 +88,8 @@ births = pd.read_parquet(
 )
 
 births["id_sinasc"] = births["id_sinasc"].astype(int)
-births["DATA"] = pd.to_datetime(births["DTNASC"], format="%d%m%Y")
-births['YEAR'] = pd.to_datetime(births['DATA']).dt.year
+births["DATA"] = births["DTNASC"]
+births['YEAR'] = births['DATA'].dt.year
 births["CODMUNICIPIO"] = births["CODMUNNASC"]
 
 births = births.drop(columns=["DTNASC", "CODMUNNASC"])
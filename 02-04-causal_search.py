@@ -17,7 +17,8 @@ RESULTS_DIR = "observational_data/results/"
 
 ROUNDS = 100
 N_JOBS = 8
-N_JOBS_KNN = 8  # used only for PS matching (currently disabled)
+BOOTSTRAP_WEIGHTING = "multinomial"  # None -> resample rows with df.sample
+BENCHMARK_PS = False  # report cold vs warm-started propensity iterations
 
 print("\nSTART")
 print(datetime.datetime.now())
@@ -38,9 +39,10 @@ df = pd.read_parquet(
 
 df["YEAR"] = pd.to_datetime(df["DATA"]).dt.year
 
-# Keep valid observations only
+# Keep valid observations only (IDANOMAL is an int8 code, 9 = ignored)
 df = df.loc[
-    (df["IDANOMAL"] != "9") &
+    (df["IDANOMAL"] != 9) &
+    (df["IDANOMAL"].notna()) &
     (df["heat_event"].notna())
 ].copy()
 
@@ -73,109 +75,91 @@ results = {}
 # Linear regression (causal)
 # ------------------------------------------------------
 log_step("Linear regression (D + Z + W)")
-results["linreg_causal_zw"] = bootstrap(
+results["linreg_causal_zw"] = bootstrap_batch(
     df_calc,
-    linreg_causal_estimator,
+    linreg_causal_batch_estimator,
     model_exp="D+Z+W",
     rounds=ROUNDS,
-    n_jobs=N_JOBS,
+    weighting=BOOTSTRAP_WEIGHTING,
 )
 print("Estimated ATE:", results["linreg_causal_zw"])
 
 log_step("Linear regression (D + Z)")
-results["linreg_causal_z"] = bootstrap(
+results["linreg_causal_z"] = bootstrap_batch(
     df_calc,
-    linreg_causal_estimator,
+    linreg_causal_batch_estimator,
     model_exp="D+Z",
     rounds=ROUNDS,
-    n_jobs=N_JOBS,
+    weighting=BOOTSTRAP_WEIGHTING,
 )
 print("Estimated ATE:", results["linreg_causal_z"])
 
 log_step("Linear regression (D + W)")
-results["linreg_causal_w"] = bootstrap(
+results["linreg_causal_w"] = bootstrap_batch(
     df_calc,
-    linreg_causal_estimator,
+    linreg_causal_batch_estimator,
     model_exp="D+W",
     rounds=ROUNDS,
-    n_jobs=N_JOBS,
+    weighting=BOOTSTRAP_WEIGHTING,
 )
 print("Estimated ATE:", results["linreg_causal_w"])
 
 # ------------------------------------------------------
-# Potential outcome model
-# ------------------------------------------------------
-log_step("Linear regression (potential outcomes)")
-results["linreg_potentialoutcome"] = bootstrap(
-    df_calc,
-    linreg_potentialoutcome_estimator,
-    rounds=ROUNDS,
-    n_jobs=N_JOBS,
-)
-print("Estimated ATE:", results["linreg_potentialoutcome"])
-
-# ------------------------------------------------------
-# IPW estimators
+# IPW and doubly robust: propensity models of a batch of
+# replicates fitted together (batched IRLS), in this process.
+# Same replicates as bootstrap_many below, but their
+# estimates are not part of its paired per-round output.
 # ------------------------------------------------------
 log_step("IPW")
-results["ipw"] = bootstrap(
+results["ipw"] = bootstrap_batch(
     df_calc,
-    ipw_estimator,
+    ipw_batch_estimator,
     rounds=ROUNDS,
-    n_jobs=N_JOBS,
+    weighting=BOOTSTRAP_WEIGHTING,
 )
 print("Estimated ATE:", results["ipw"])
 
-log_step("IPW (stabilized)")
-results["ipw_stabilized"] = bootstrap(
-    df_calc,
-    ipw_stabilized_estimator,
-    rounds=ROUNDS,
-    n_jobs=N_JOBS,
-)
-print("Estimated ATE:", results["ipw_stabilized"])
-
-# ------------------------------------------------------
-# Propensity score regression
-# ------------------------------------------------------
-log_step("Propensity score regression")
-results["ps_linreg"] = bootstrap(
+log_step("Doubly robust")
+results["double_robust"] = bootstrap_batch(
     df_calc,
-    ps_linreg_estimator,
+    double_robust_batch_estimator,
     rounds=ROUNDS,
-    n_jobs=N_JOBS,
+    weighting=BOOTSTRAP_WEIGHTING,
 )
-print("Estimated ATE:", results["ps_linreg"])
+print("Estimated ATE:", results["double_robust"])
 
-# ------------------------------------------------------
-# Propensity score matching (intentionally disabled)
-# ------------------------------------------------------
-# log_step("Propensity score matching")
-# results["ps_matching"] = bootstrap(
-#     df_calc,
-#     ps_matching_estimator,
-#     rounds=ROUNDS,
-#     n_jobs=N_JOBS,
-#     n_jobs_knn=N_JOBS_KNN,
-# )
-# print("Estimated ATE:", results["ps_matching"])
+if BENCHMARK_PS:
+    log_step("Propensity fits: cold vs warm start")
+    print(benchmark_ps_warm_start(df_calc, rounds=10))
 
 # ------------------------------------------------------
-# Doubly robust estimator
+# Potential outcome, stabilized IPW, propensity score and
+# matching estimators (one resample per round, shared)
 # ------------------------------------------------------
-log_step("Doubly robust estimator")
-results["double_robust"] = bootstrap(
+log_step("Potential outcomes, stabilized IPW, PS regression and matching")
+estimators = {
+    "linreg_potentialoutcome": (linreg_potentialoutcome_estimator, {}),
+    "ipw_stabilized": (ipw_stabilized_estimator, {}),
+    "ps_linreg": (ps_linreg_estimator, {}),
+    "ps_matching": (ps_matching_estimator, {}),
+    "covariate_matching": (covariate_matching_estimator, {"covariates": ["Z", "W"]}),
+}
+df_bootstrap = bootstrap_many(
     df_calc,
-    double_robust_estimator,
+    estimators,
     rounds=ROUNDS,
     n_jobs=N_JOBS,
+    weighting=BOOTSTRAP_WEIGHTING,
 )
-print("Estimated ATE:", results["double_robust"])
+print(df_bootstrap)
 
 # ======================================================
 # Save results
 # ======================================================
-df_results = results_to_df(results)
+df_results = pd.concat(
+    [results_to_df(results), df_bootstrap],
+    ignore_index=True,
+)
 
 timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
 filename = (
@@ -1,42 +1,495 @@
 from joblib import Parallel, delayed
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import datetime 
+import hashlib
+import inspect
+import os
+import shutil
+import tempfile
 
 # -------------------------------
 # Bootstrap
 # -------------------------------
+def replicate_rng(seed, i):
+    """
+    Random generator of bootstrap round i.
+
+    Same stream as np.random.SeedSequence(seed).spawn(rounds)[i], built
+    directly so that a single round can be re-run on its own.
+    """
+
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key = (i,)))
+
+
+def bootstrap_weights(n, weighting = "multinomial", rng = None):
+    """
+    Draw one bootstrap replicate as a vector of per-row weights.
+
+    "multinomial": resampling counts of n rows drawn with replacement.
+    "poisson":     independent Poisson(1) counts (approximate bootstrap).
+    """
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    if weighting == "multinomial":
+        idx = rng.integers(0, n, size = n)
+        return np.bincount(idx, minlength = n)
+    if weighting == "poisson":
+        return rng.poisson(1, size = n)
+
+    raise ValueError(f"Unknown bootstrap weighting: {weighting!r}")
+
+
+def bootstrap_round(df, seed, i, weighting = None):
+    """
+    Estimator arguments for bootstrap round i: the resampled frame, or the
+    original frame plus `weights=` (see bootstrap_weights).
+
+    Depends only on (seed, i, weighting), never on which process or in
+    which order rounds run, so any round can be reproduced for debugging.
+    """
+
+    rng = replicate_rng(seed, i)
+
+    if weighting is None:
+        return {"df": df.take(rng.integers(0, len(df), size = len(df)))}
+
+    return {"df": df, "weights": bootstrap_weights(len(df), weighting, rng)}
+
+
 def bootstrap(df, 
               estimator, 
               n_jobs = 8, 
               rounds =500, 
               seed = 1944, 
               percentiles = [2.5,97.5], 
+              weighting = None,
+              cache_ps = False,
               **kwargs
               ):
     """
     Bootstrap an estimator and return the mean estimate and confidence interval.
+
+    weighting: None resamples rows. "multinomial" or "poisson" never builds
+               resampled frames; the estimator gets the original df plus
+               `weights=` per-row counts (see bootstrap_weights).
+    cache_ps:  pass `ps_key=` (data fingerprint, seed, weighting, round) so
+               PS-based estimators share fitted propensity models per round.
+
+    Each round draws from its own generator (replicate_rng), so results
+    are identical for any n_jobs.
     """
 
-    np.random.seed(seed)
+    fingerprint = data_fingerprint(df) if cache_ps else None
+
+    def round_kwargs(i):
+        if cache_ps:
+            return {"ps_key": (fingerprint, seed, weighting, i), **kwargs}
+        return kwargs
 
     if n_jobs == 1:
         stats = []
         for i in range(rounds):
-            sample = df.sample(frac=1, replace = True)
-            stats.append(estimator(sample, **kwargs))
+            stats.append(_run_round(df, estimator, seed, i, weighting, **round_kwargs(i)))
     else:
-        stats = Parallel(n_jobs = n_jobs, backend='loky', verbose=5)(
-            delayed(estimator)(
-                df.sample(frac=1, replace = True), 
-                **kwargs
-                )
-            for _ in range(rounds)
-        )
+        # Workers read the data from a shared memory map and draw
+        # their own resample from the round's seed
+        handle = share_frame(df)
+        try:
+            stats = Parallel(n_jobs = n_jobs, backend='loky', verbose=5)(
+                delayed(_run_round)(
+                    handle, 
+                    estimator, 
+                    seed, 
+                    i, 
+                    weighting, 
+                    **round_kwargs(i)
+                    )
+                for i in range(rounds)
+            )
+        finally:
+            release_shared_frame(handle)
+
+    return np.mean(stats), np.percentile(stats, percentiles)
+
+
+def _run_round(data, func, seed, i, weighting, **kwargs):
+    """
+    Run func on bootstrap round i of `data`, a DataFrame or a
+    share_frame handle (opened inside the worker).
+    """
+
+    df = load_shared_frame(data) if isinstance(data, dict) else data
+
+    return func(**bootstrap_round(df, seed, i, weighting), **kwargs)
+
+
+# -------------------------------
+# Shared dataset for workers
+# -------------------------------
+def share_frame(df, folder = None):
+    """
+    Write the columns of a DataFrame once to disk, so worker processes can
+    memory-map them read-only instead of receiving pickled copies. Returns
+    a small, cheap-to-pickle handle.
+
+    NumPy-typed columns are saved as .npy files and categoricals as their
+    codes. Other columns (strings, nullable integers, ...) and a
+    non-default index are pickled once to the same folder and loaded
+    unchanged by each worker.
+    """
+
+    folder = tempfile.mkdtemp(prefix = "shared_frame_", dir = folder)
+
+    columns = {}
+    categories = {}
+    other = []
+    for i, (col, dtype) in enumerate(df.dtypes.items()):
+        values = df[col]
+        if isinstance(dtype, pd.CategoricalDtype):
+            values = values.cat.codes
+            categories[col] = dtype
+        elif not (isinstance(dtype, np.dtype) and dtype.kind in "biufcmM"):
+            other.append(col)
+            continue
+
+        path = os.path.join(folder, f"{i}.npy")
+        np.save(path, values.to_numpy())
+        columns[col] = path
+
+    rest = None
+    if other or not df.index.equals(pd.RangeIndex(len(df))):
+        rest = os.path.join(folder, "rest.pkl")
+        df[other].to_pickle(rest)
+
+    return {
+        "folder": folder,
+        "columns": columns,
+        "categories": categories,
+        "rest": rest,
+        "order": list(df.columns),
+    }
+
+
+def load_shared_frame(handle):
+    """
+    DataFrame over the memory-mapped columns of a share_frame handle,
+    with the pickled columns and index read back as they were.
+    """
+
+    data = {}
+    for col, path in handle["columns"].items():
+        values = np.load(path, mmap_mode = "r")
+        if col in handle["categories"]:
+            values = pd.Categorical.from_codes(values, dtype = handle["categories"][col])
+        data[col] = values
+
+    index = None
+    if handle["rest"] is not None:
+        rest = pd.read_pickle(handle["rest"])
+        index = rest.index
+        data.update({col: rest[col].array for col in rest.columns})
+
+    return pd.DataFrame(
+        {col: data[col] for col in handle["order"]},
+        index = index,
+        copy = False,
+    )
+
+
+def release_shared_frame(handle):
+    """
+    Delete the files behind a share_frame handle.
+    """
+
+    shutil.rmtree(handle["folder"], ignore_errors = True)
+
+
+def bootstrap_batch(df, 
+                    estimator, 
+                    rounds = 500, 
+                    seed = 1944, 
+                    percentiles = [2.5,97.5], 
+                    weighting = "multinomial",
+                    batch_size = 50,
+                    max_weight_bytes = 256 * 2**20,
+                    **kwargs
+                    ):
+    """
+    Bootstrap a batched estimator, which receives a (batch_size, n) matrix
+    of replicate weights and returns one estimate per row.
+
+    Batches are shrunk so that the int32 weights matrix stays within
+    `max_weight_bytes` (about 6 replicates of 10M rows with the default).
+    Estimators that take `ps_key=` get (data fingerprint, seed, weighting),
+    so work shared by all batches (the full-sample propensity fit) is done
+    once. Draws the same replicates as bootstrap(..., weighting=weighting).
+    """
+
+    batch_size = max(1, min(batch_size, max_weight_bytes // (4 * len(df))))
+
+    if "ps_key" in inspect.signature(estimator).parameters:
+        kwargs = {"ps_key": (data_fingerprint(df), seed, weighting), **kwargs}
+
+    stats = []
+    for start in range(0, rounds, batch_size):
+        size = min(batch_size, rounds - start)
+
+        weights = np.empty((size, len(df)), dtype=np.int32)
+        for i in range(size):
+            weights[i] = bootstrap_weights(len(df), weighting, replicate_rng(seed, start + i))
+
+        stats.append(estimator(df, weights = weights, **kwargs))
+
+    stats = np.concatenate(stats)
+
+    return np.mean(stats), np.percentile(stats, percentiles)
+
+
+def bootstrap_many(df, 
+                   estimators, 
+                   n_jobs = 8, 
+                   rounds = 500, 
+                   seed = 1944, 
+                   percentiles = [2.5,97.5], 
+                   weighting = None,
+                   return_replicates = False
+                   ):
+    """
+    Bootstrap several estimators on the same resamples.
+
+    estimators: {name: (estimator, kwargs)}. Each round is drawn once and
+                every estimator is evaluated on it inside the worker;
+                PS-based estimators share one propensity fit per round.
+
+    Returns the summary as a tidy frame (same layout as results_to_df) and,
+    with return_replicates, also the paired per-round estimates.
+    """
+
+    fingerprint = data_fingerprint(df)
+
+    def round_kwargs(i):
+        return {"estimators": estimators, "ps_key": (fingerprint, seed, weighting, i)}
+
+    if n_jobs == 1:
+        stats = []
+        for i in range(rounds):
+            stats.append(_run_round(df, _evaluate_estimators, seed, i, weighting, **round_kwargs(i)))
+    else:
+        handle = share_frame(df)
+        try:
+            stats = Parallel(n_jobs = n_jobs, backend='loky', verbose=5)(
+                delayed(_run_round)(
+                    handle, 
+                    _evaluate_estimators, 
+                    seed, 
+                    i, 
+                    weighting, 
+                    **round_kwargs(i)
+                    )
+                for i in range(rounds)
+            )
+        finally:
+            release_shared_frame(handle)
+
+    replicates = pd.DataFrame(stats, columns = list(estimators))
+
+    summary = results_to_df({
+        method: (replicates[method].mean(), np.percentile(replicates[method], percentiles))
+        for method in replicates.columns
+    })
+
+    if return_replicates:
+        return summary, replicates
+
+    return summary
+
+
+def _evaluate_estimators(df, estimators, weights = None, ps_key = None):
+    """
+    Evaluate every estimator on one bootstrap round.
+    """
+
+    stats = {}
+    for method, (estimator, kwargs) in estimators.items():
+        args = dict(kwargs)
+        if weights is not None:
+            args["weights"] = weights
+        if "ps_key" in inspect.signature(estimator).parameters:
+            args["ps_key"] = ps_key
+
+        stats[method] = estimator(df, **args)
+
+    return stats
+
+
+def data_fingerprint(df):
+    """
+    Content hash of a DataFrame (values and index), used as a cache key.
+    """
+
+    hashes = pd.util.hash_pandas_object(df, index = True).to_numpy()
+
+    return hashlib.sha1(hashes.tobytes()).hexdigest()
+
+
+# -------------------------------
+# Cell-count bootstrap
+# -------------------------------
+def compress_cells(df, keys = ["Z", "W", "D"], outcome_var = "Y"):
+    """
+    Compress a frame with discrete covariates into one row per cell of
+    `keys`, holding the outcome sufficient statistics n, sum_y and sum_y2.
+    """
+
+    y = df[outcome_var].to_numpy(dtype=float)
+
+    return (
+        df[keys]
+        .assign(n = 1, sum_y = y, sum_y2 = y ** 2)
+        .groupby(keys, as_index = False)[["n", "sum_y", "sum_y2"]]
+        .sum()
+    )
+
+
+def bootstrap_cells(cells, 
+                    estimator, 
+                    rounds = 500, 
+                    seed = 1944, 
+                    percentiles = [2.5,97.5], 
+                    outcome_var = "Y",
+                    **kwargs
+                    ):
+    """
+    Bootstrap an estimator on a compress_cells frame, in O(cells) per round.
+
+    Each round draws the cell counts from a multinomial over the cells and
+    the resampled outcome mean of each cell from its normal approximation,
+    which is exact when Y is constant within cells (e.g. a binary outcome
+    included in `keys`). The estimator gets the cells, with `outcome_var`
+    holding the replicate cell means, and `weights=` the replicate counts.
+
+    Valid for estimators linear in Y whose covariates are all in `keys`:
+    naive, adjustment formula and regressions on the keys.
+    """
+
+    n = cells["n"].to_numpy()
+    mean_y = cells["sum_y"].to_numpy() / n
+    var_y = np.maximum(cells["sum_y2"].to_numpy() / n - mean_y ** 2, 0)
+
+    stats = []
+    for i in range(rounds):
+        rng = replicate_rng(seed, i)
+        counts = rng.multinomial(n.sum(), n / n.sum())
+        y = mean_y + np.sqrt(var_y / np.maximum(counts, 1)) * rng.standard_normal(len(n))
+
+        stats.append(estimator(cells.assign(**{outcome_var: y}), weights = counts, **kwargs))
 
     return np.mean(stats), np.percentile(stats, percentiles)
 
 
+# --------------------------------
+# Streaming parquet reader
+# --------------------------------
+def iter_row_groups(path, columns = None):
+    """
+    Yield a parquet file one row group at a time as DataFrames, so memory
+    stays bounded by the row-group size (see generate_data.write_data_chunks).
+    """
+
+    parquet_file = pq.ParquetFile(path)
+
+    for i in range(parquet_file.num_row_groups):
+        yield (
+            parquet_file.read_row_group(i, columns = columns)
+            .to_pandas(date_as_object = False, types_mapper = _NULLABLE_INTS.get)
+        )
+
+
+# --------------------------------
+# Compact schema for processed SINASC / SIM files
+# --------------------------------
+# Declared storage types; columns not listed are written as they are
+HEALTH_SCHEMA = {
+    "DTNASC": pa.date32(),
+    "CODMUNNASC": pa.int32(),
+    "CODMUNNATU": pa.int32(),
+    "IDADEMAE": pa.int16(),
+    "ESCMAE": pa.int8(),
+    "RACACOR": pa.int8(),
+    "RACACORMAE": pa.int8(),
+    "IDANOMAL": pa.int8(),
+    "SEXO": pa.int8(),
+    "risk_score": pa.float32(),
+}
+
+# Small integer columns are read as nullable dtypes, so nulls do not
+# turn codes into float64
+_NULLABLE_INTS = {
+    pa.int8(): pd.Int8Dtype(),
+    pa.int16(): pd.Int16Dtype(),
+    pa.int32(): pd.Int32Dtype(),
+}
+
+# Older files code SEXO as letters
+SEXO_CODES = {"M": "1", "F": "2", "I": "0"}
+
+
+def write_health_parquet(df, path, date_format = "%d%m%Y"):
+    """
+    Write a processed SINASC / SIM frame with HEALTH_SCHEMA.
+
+    Code columns are stored as int8, municipality codes as int32 and
+    DTNASC as date32 (parsed here from `date_format` strings if needed),
+    so readers get numeric keys and dates without re-parsing. Values that
+    do not parse are stored as nulls.
+    """
+
+    df = df.copy()
+
+    for col, dtype in HEALTH_SCHEMA.items():
+        if col not in df.columns:
+            continue
+
+        if pa.types.is_date(dtype):
+            if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = pd.to_datetime(df[col], format = date_format, errors = "coerce")
+        elif pa.types.is_integer(dtype):
+            values = df[col].replace(SEXO_CODES) if col == "SEXO" else df[col]
+            df[col] = pd.to_numeric(values, errors = "coerce")
+        else:
+            df[col] = df[col].astype(dtype.to_pandas_dtype())
+
+    table = pa.Table.from_pandas(df, preserve_index = False)
+
+    for col, dtype in HEALTH_SCHEMA.items():
+        if col in table.column_names:
+            table = table.set_column(
+                table.schema.get_field_index(col),
+                pa.field(col, dtype),
+                pc.cast(table[col], dtype),
+            )
+
+    pq.write_table(table, path)
+
+
+def read_health_parquet(path, columns = None):
+    """
+    Read a file written by write_health_parquet. Dates come back as
+    datetime64 and code columns as (nullable) integers.
+    """
+
+    return pq.read_table(path, columns = columns).to_pandas(
+        date_as_object = False,
+        types_mapper = _NULLABLE_INTS.get,
+    )
+
+
 # --------------------------------
 # results to df
 # --------------------------------
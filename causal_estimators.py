@@ -1,22 +1,128 @@
+from collections import OrderedDict
+import time
+import warnings
+
 import pandas as pd
 import numpy as np
 
+from scipy.spatial import cKDTree
+from scipy.special import expit
 from sklearn.linear_model import LinearRegression, LogisticRegression
-from sklearn.neighbors import KNeighborsRegressor
-from patsy import dmatrix
+from patsy import ModelDesc, build_design_matrices, dmatrix
+
+
+# ------------------------------------
+# Weighted helpers
+# ------------------------------------
+def _weighted_mean(values, weights=None):
+    """
+    Mean of `values`, optionally weighted by bootstrap counts.
+    """
+
+    if weights is None:
+        return np.mean(values)
+
+    return np.average(values, weights=weights)
+
+
+# ------------------------------------
+# Design matrices (shared cache)
+# ------------------------------------
+# Parsed formulas, and full-frame matrices kept in least-recently-used
+# order up to DESIGN_CACHE_BYTES
+DESIGN_CACHE_BYTES = 1 << 30
+_formula_descs = {}
+_design_matrices = OrderedDict()
+_design_cache_stats = {"hits": 0, "misses": 0, "bytes": 0}
+
+
+def design_matrix(formula, df, data_key=None):
+    """
+    Design matrix of `formula` on `df` as a float ndarray.
+
+    Each formula string is parsed once (patsy ModelDesc); categorical
+    levels and stateful transforms such as center() are still learned
+    from `df` itself. With a `data_key` identifying `df` (see _data_key),
+    the full-frame matrix is built once, kept read-only in an LRU cache
+    bounded by DESIGN_CACHE_BYTES, and callers take row subsets of it
+    (e.g. X[is_treated]) instead of rebuilding it per arm.
+    """
+
+    if data_key is not None:
+        key = (formula, data_key)
+        if key in _design_matrices:
+            _design_cache_stats["hits"] += 1
+            _design_matrices.move_to_end(key)
+            return _design_matrices[key]
+
+    if formula not in _formula_descs:
+        _formula_descs[formula] = ModelDesc.from_formula(formula)
+
+    X = np.asarray(dmatrix(_formula_descs[formula], df), dtype=float)
+
+    if data_key is not None:
+        _design_cache_stats["misses"] += 1
+        X.setflags(write=False)
+        _design_matrices[key] = X
+        _design_cache_stats["bytes"] += X.nbytes
+
+        while _design_cache_stats["bytes"] > DESIGN_CACHE_BYTES:
+            _, evicted = _design_matrices.popitem(last=False)
+            _design_cache_stats["bytes"] -= evicted.nbytes
+
+    return X
+
+
+def _data_key(ps_key, weights):
+    """
+    Design cache key of the frame an estimator receives: in weighted
+    bootstrap rounds it is the full frame, identified by the data
+    fingerprint of `ps_key`; resampled frames are not cached.
+    """
+
+    if ps_key is None or weights is None:
+        return None
+
+    return ps_key[0]
+
+
+def design_cache_info():
+    """
+    Hit/miss counts, entries and bytes of this process's design cache.
+    """
+
+    return {**_design_cache_stats, "size": len(_design_matrices)}
+
+
+def clear_design_cache():
+    """
+    Drop all parsed formulas and cached design matrices.
+    """
+
+    _formula_descs.clear()
+    _design_matrices.clear()
+    _design_cache_stats.update(hits=0, misses=0, bytes=0)
 
 
 # ------------------------------------
 # Naive estimator
 # ------------------------------------
-def naive_estimator(df):
+def naive_estimator(df, weights=None):
     """
     Unadjusted ATE: difference in mean outcomes
     between treated and control groups.
     """
 
-    mean_Y_treated = df.loc[df["D"] == 1, "Y"].mean()
-    mean_Y_control = df.loc[df["D"] == 0, "Y"].mean()
+    if weights is None:
+        mean_Y_treated = df.loc[df["D"] == 1, "Y"].mean()
+        mean_Y_control = df.loc[df["D"] == 0, "Y"].mean()
+    else:
+        weights = np.asarray(weights)
+        treated = (df["D"] == 1).to_numpy()
+        control = (df["D"] == 0).to_numpy()
+
+        mean_Y_treated = _weighted_mean(df["Y"].to_numpy()[treated], weights[treated])
+        mean_Y_control = _weighted_mean(df["Y"].to_numpy()[control], weights[control])
 
     return mean_Y_treated - mean_Y_control
 
@@ -24,41 +130,227 @@ def naive_estimator(df):
 # ------------------------------------
 # Adjustment formula estimator
 # ------------------------------------
-def adjustment_formula_estimator(df, adjustment_set):
+def adjustment_formula_estimator(
+    df,
+    adjustment_set,
+    weights=None,
+    cell_stats=None,
+):
     """
     ATE via the adjustment formula over a given set of confounders.
+
+    Works on per-(stratum, D) counts and outcome sums. Pass `cell_stats`
+    (see adjustment_cell_stats) to skip the raw rows entirely.
     """
 
-    group = df.groupby(adjustment_set)
+    if cell_stats is None:
+        cell_stats = adjustment_cell_stats(df, adjustment_set, weights)
+
+    cells = cell_stats[["n", "sum_y"]].unstack("D", fill_value=0)
+    n1, n0 = cells["n"][1].to_numpy(), cells["n"][0].to_numpy()
+    sum_y1, sum_y0 = cells["sum_y"][1].to_numpy(), cells["sum_y"][0].to_numpy()
+
+    # P(Z = z), over strata present in this (re)sample
+    n_strata = n1 + n0
+    p = n_strata / n_strata.sum()
 
-    # P(Z = z)
-    p = group.size() / len(df)
+    # E[Y | D = 1, Z = z] and E[Y | D = 0, Z = z],
+    # with the arm mean as fallback for empty strata
+    mu1 = np.full(len(p), sum_y1.sum() / n1.sum())
+    mu0 = np.full(len(p), sum_y0.sum() / n0.sum())
+    np.divide(sum_y1, n1, out=mu1, where=n1 > 0)
+    np.divide(sum_y0, n0, out=mu0, where=n0 > 0)
 
-    # E[Y | D = 1, Z = z] and E[Y | D = 0, Z = z]
-    mu1 = group.apply(lambda g: g.loc[g["D"] == 1, "Y"].mean())
-    mu0 = group.apply(lambda g: g.loc[g["D"] == 0, "Y"].mean())
+    return np.sum((mu1 - mu0) * p)
+
+
+def adjustment_cell_stats(
+    df,
+    adjustment_set,
+    weights=None,
+    treatment_var="D",
+    outcome_var="Y",
+):
+    """
+    Weighted count `n` and outcome sum `sum_y` per (stratum, D) cell,
+    computed in a single groupby.
+    """
 
-    # Fallback for empty strata
-    mu1 = mu1.fillna(df.loc[df["D"] == 1, "Y"].mean())
-    mu0 = mu0.fillna(df.loc[df["D"] == 0, "Y"].mean())
+    if weights is None:
+        weights = np.ones(len(df))
+    weights = np.asarray(weights, dtype=float)
 
-    return ((mu1 - mu0) * p).sum()
+    return (
+        df[adjustment_set]
+        .assign(
+            D=df[treatment_var].to_numpy(),
+            n=weights,
+            sum_y=weights * df[outcome_var].to_numpy(),
+        )
+        .groupby(adjustment_set + ["D"])[["n", "sum_y"]]
+        .sum()
+    )
 
 
 # ------------------------------------
 # Linear regression: causal estimate
 # ------------------------------------
-def linreg_causal_estimator(df, model_exp, outcome_var="Y"):
+def linreg_causal_estimator(df, model_exp, outcome_var="Y", weights=None):
     """
     Linear regression coefficient on treatment indicator.
     """
 
-    X = dmatrix(model_exp, df)
-    model = LinearRegression().fit(X, df[outcome_var])
+    X = design_matrix(model_exp, df)
+    model = LinearRegression().fit(X, df[outcome_var], sample_weight=weights)
 
     return model.coef_[1]
 
 
+def linreg_causal_batch_estimator(
+    df,
+    model_exp,
+    outcome_var="Y",
+    weights=None,
+    chunk_size=1_000_000,
+):
+    """
+    Treatment coefficient of linreg_causal_estimator for many bootstrap
+    replicates at once.
+
+    weights: (rounds, n) matrix of per-row bootstrap weights. The design
+    matrix is built once and the weighted normal equations of every
+    replicate are accumulated with one matrix product per row chunk.
+    Returns an array with one coefficient per replicate.
+    """
+
+    X = design_matrix(model_exp, df)
+    y = df[outcome_var].to_numpy(dtype=float)
+
+    if weights is None:
+        weights = np.ones((1, len(df)))
+
+    XtWX, XtWy = _weighted_normal_equations(X, y, np.atleast_2d(weights), chunk_size)
+    beta = _solve_batch(XtWX, XtWy)
+
+    return beta[:, 1]
+
+
+def _weighted_normal_equations(X, y, weights, chunk_size=1_000_000, mask=None):
+    """
+    X'WX and X'Wy for every row of `weights`, accumulated over row chunks.
+
+    With a boolean `mask`, only the masked rows enter the sums; rows are
+    still read chunk by chunk, so no masked copy of `weights` is made.
+    """
+
+    n, k = X.shape
+    rounds = weights.shape[0]
+
+    XtWX = np.zeros((rounds, k * k))
+    XtWy = np.zeros((rounds, k))
+
+    for start in range(0, n, chunk_size):
+        rows = slice(start, start + chunk_size)
+        X_chunk = X[rows]
+        w_chunk = weights[:, rows].astype(float)
+        if mask is not None:
+            w_chunk *= mask[rows]
+
+        # Row-wise outer products x x', flattened to k*k columns
+        outer = (X_chunk[:, :, None] * X_chunk[:, None, :]).reshape(-1, k * k)
+
+        XtWX += w_chunk @ outer
+        XtWy += w_chunk @ (X_chunk * y[rows, None])
+
+    return XtWX.reshape(rounds, k, k), XtWy
+
+
+def _solve_batch(A, b):
+    """
+    Solve the stacked systems A[r] x[r] = b[r]. Falls back to the
+    minimum-norm least-squares solution (pseudo-inverse) when a system is
+    singular, e.g. a replicate with no rows in a cell of the design.
+    """
+
+    try:
+        return np.linalg.solve(A, b[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        return (np.linalg.pinv(A) @ b[..., None])[..., 0]
+
+
+# ------------------------------------
+# Streaming estimators
+# ------------------------------------
+def naive_streaming_estimator(chunks, treatment_var="D", outcome_var="Y"):
+    """
+    naive_estimator over an iterable of DataFrame chunks (e.g.
+    aux_functions.iter_row_groups), merging per-arm counts and sums.
+    """
+
+    cells = _streaming_cell_stats(chunks, [], treatment_var, outcome_var)
+
+    mean_Y_treated = cells.loc[1, "sum_y"] / cells.loc[1, "n"]
+    mean_Y_control = cells.loc[0, "sum_y"] / cells.loc[0, "n"]
+
+    return mean_Y_treated - mean_Y_control
+
+
+def adjustment_formula_streaming_estimator(
+    chunks, adjustment_set, treatment_var="D", outcome_var="Y"
+):
+    """
+    adjustment_formula_estimator over an iterable of DataFrame chunks,
+    merging the per-(stratum, D) cell statistics of each chunk.
+    """
+
+    cells = _streaming_cell_stats(chunks, adjustment_set, treatment_var, outcome_var)
+
+    return adjustment_formula_estimator(None, adjustment_set, cell_stats=cells)
+
+
+def linreg_causal_streaming_estimator(chunks, model_exp, outcome_var="Y"):
+    """
+    linreg_causal_estimator over an iterable of DataFrame chunks, by
+    accumulating X'X and X'y.
+
+    The design is fixed by the first chunk, so categorical terms must
+    have all their levels present there.
+    """
+
+    design_info = None
+    XtX = Xty = 0
+
+    for chunk in chunks:
+        if design_info is None:
+            design_info = dmatrix(model_exp, chunk).design_info
+
+        X = np.asarray(build_design_matrices([design_info], chunk)[0])
+        y = chunk[outcome_var].to_numpy(dtype=float)
+
+        XtX = XtX + X.T @ X
+        Xty = Xty + X.T @ y
+
+    return np.linalg.solve(XtX, Xty)[1]
+
+
+def _streaming_cell_stats(chunks, adjustment_set, treatment_var, outcome_var):
+    """
+    Sum of adjustment_cell_stats over chunks, keeping one chunk in memory.
+    """
+
+    cells = None
+    for chunk in chunks:
+        part = adjustment_cell_stats(
+            chunk,
+            adjustment_set,
+            treatment_var=treatment_var,
+            outcome_var=outcome_var,
+        )
+        cells = part if cells is None else cells.add(part, fill_value=0)
+
+    return cells
+
+
 # ------------------------------------
 # Linear regression: outcome model
 # ------------------------------------
@@ -67,80 +359,440 @@ def linreg_potentialoutcome_estimator(
     model_exp="W+Z",
     treatment_var="D",
     outcome_var="Y",
+    weights=None,
+    ps_key=None,
 ):
     """
     ATE from separate outcome models for treated and control units.
+
+    The design matrix is built once (cached across weighted bootstrap
+    rounds through `ps_key`) and each arm's model is fitted on its rows.
     """
 
-    df_control = df.loc[df[treatment_var] == 0]
+    X = design_matrix(model_exp, df, _data_key(ps_key, weights))
+    y = df[outcome_var].to_numpy()
+
+    is_control = (df[treatment_var] == 0).to_numpy()
     control_model = LinearRegression().fit(
-        dmatrix(model_exp, df_control),
-        df_control[outcome_var],
+        X[is_control],
+        y[is_control],
+        sample_weight=None if weights is None else np.asarray(weights)[is_control],
     )
 
-    df_treated = df.loc[df[treatment_var] == 1]
+    is_treated = (df[treatment_var] == 1).to_numpy()
     treated_model = LinearRegression().fit(
-        dmatrix(model_exp, df_treated),
-        df_treated[outcome_var],
+        X[is_treated],
+        y[is_treated],
+        sample_weight=None if weights is None else np.asarray(weights)[is_treated],
     )
 
-    ate = np.mean(
+    ate = _weighted_mean(
         df[treatment_var]
-        * (df[outcome_var] - control_model.predict(dmatrix(model_exp, df)))
+        * (df[outcome_var] - control_model.predict(X))
         + (1 - df[treatment_var])
-        * (treated_model.predict(dmatrix(model_exp, df)) - df[outcome_var])
+        * (treated_model.predict(X) - df[outcome_var]),
+        weights,
     )
 
     return ate
 
 
+# ------------------------------------
+# Propensity score model (shared cache)
+# ------------------------------------
+# Models of the current bootstrap round only (one per formula)
+_ps_models = {}
+_ps_cache_stats = {"hits": 0, "misses": 0}
+
+# Full-sample fits that seed the weighted replicates of the current
+# bootstrap run (one per formula), and fit counters
+_ps_warm_starts = {}
+_ps_fit_stats = {"fits": 0, "iterations": 0, "warm_fits": 0, "warm_iterations": 0}
+
+
+def fit_propensity_model(
+    df, model_exp="Z", treatment_var="D", weights=None, ps_key=None, warm_start=True
+):
+    """
+    Logistic propensity model for the treatment given `model_exp`.
+
+    `ps_key` identifies the data and bootstrap replicate being fitted (see
+    bootstrap(..., cache_ps=True)). Fitted models are cached under
+    (ps_key, model_exp, treatment_var), so every PS-based estimator run on
+    the same replicate in the same process shares a single fit; a new
+    replicate drops the models of the previous one.
+
+    With `warm_start`, weighted replicates (where `df` is the full frame)
+    start the solver from the unweighted full-sample fit instead of from
+    zero. The seed depends only on the data, so estimates do not depend
+    on n_jobs or on earlier runs; resampled replicates always start cold.
+    Iteration counts are in ps_cache_info().
+    """
+
+    if ps_key is None:
+        return _fit_logistic(design_matrix(model_exp, df), df[treatment_var], weights)
+
+    key = (ps_key, model_exp, treatment_var)
+    if key in _ps_models:
+        _ps_cache_stats["hits"] += 1
+        return _ps_models[key]
+
+    _ps_cache_stats["misses"] += 1
+
+    X = design_matrix(model_exp, df, _data_key(ps_key, weights))
+
+    init = None
+    if warm_start and weights is not None:
+        init = _warm_start_seed(
+            ps_key[:-1] + (model_exp, treatment_var),
+            lambda: _fit_logistic(X, df[treatment_var]),
+        )
+
+    model = _fit_logistic(X, df[treatment_var], weights, init=init)
+
+    if any(cached[0] != ps_key for cached in _ps_models):
+        _ps_models.clear()
+    _ps_models[key] = model
+
+    return model
+
+
+def _warm_start_seed(seed_key, fit):
+    """
+    Unweighted full-sample fit returned by `fit()`, kept for the run that
+    `seed_key` (data fingerprint, seed, weighting, formula, treatment)
+    belongs to. Each formula of a run keeps its own seed; a new run drops
+    the seeds of the previous one.
+    """
+
+    if seed_key not in _ps_warm_starts:
+        if any(key[:3] != seed_key[:3] for key in _ps_warm_starts):
+            _ps_warm_starts.clear()
+        _ps_warm_starts[seed_key] = fit()
+
+    return _ps_warm_starts[seed_key]
+
+
+def _fit_logistic(X, y, weights=None, init=None):
+    """
+    LogisticRegression fit, started from the coefficients of the fitted
+    model `init` when given. Counts fits and solver iterations.
+    """
+
+    model = LogisticRegression(warm_start=init is not None)
+    if init is not None:
+        model.coef_ = init.coef_.copy()
+        model.intercept_ = init.intercept_.copy()
+
+    model.fit(X, y, sample_weight=weights)
+
+    iterations = int(np.max(model.n_iter_))
+    prefix = "warm_" if init is not None else ""
+    _ps_fit_stats[prefix + "fits"] += 1
+    _ps_fit_stats[prefix + "iterations"] += iterations
+
+    return model
+
+
+def ps_cache_info():
+    """
+    Hit/miss counts and size of this process's propensity model cache,
+    with the number of cold and warm-started fits and their solver
+    iterations.
+    """
+
+    return {**_ps_cache_stats, **_ps_fit_stats, "size": len(_ps_models)}
+
+
+def clear_ps_cache():
+    """
+    Drop all cached propensity models and warm starts and reset the
+    counters.
+    """
+
+    _ps_models.clear()
+    _ps_warm_starts.clear()
+    _ps_cache_stats.update(hits=0, misses=0)
+    _ps_fit_stats.update(fits=0, iterations=0, warm_fits=0, warm_iterations=0)
+
+
+def benchmark_ps_warm_start(
+    df, model_exp="Z", treatment_var="D", rounds=20, seed=1944
+):
+    """
+    Propensity fits on `rounds` multinomial bootstrap weightings of `df`,
+    cold (from zero) and warm-started from the full-sample fit.
+
+    Returns one row per mode with the mean solver iterations per fit and
+    the elapsed seconds (the full-sample seed fit is not counted).
+    """
+
+    rows = []
+
+    for warm_start in (False, True):
+        clear_ps_cache()
+        rng = np.random.default_rng(seed)
+        ps_key = ("benchmark", seed, "multinomial")
+
+        if warm_start:
+            _warm_start_seed(
+                ps_key + (model_exp, treatment_var),
+                lambda: _fit_logistic(design_matrix(model_exp, df), df[treatment_var]),
+            )
+
+        start = time.perf_counter()
+        for i in range(rounds):
+            weights = rng.multinomial(len(df), np.full(len(df), 1 / len(df)))
+            fit_propensity_model(
+                df, model_exp, treatment_var, weights, ps_key + (i,), warm_start
+            )
+        elapsed = time.perf_counter() - start
+
+        prefix = "warm_" if warm_start else ""
+        fits = _ps_fit_stats[prefix + "fits"]
+        iterations = _ps_fit_stats[prefix + "iterations"]
+
+        rows.append(
+            {
+                "warm_start": warm_start,
+                "fits": fits,
+                "mean_iterations": iterations / fits,
+                "seconds": elapsed,
+            }
+        )
+
+    clear_ps_cache()
+
+    return pd.DataFrame(rows)
+
+
+# ------------------------------------
+# Batched logistic regression (IRLS)
+# ------------------------------------
+def fit_logistic_batch(
+    X, y, weights, C=1.0, init=None, max_iter=25, tol=1e-6, chunk_size=250_000
+):
+    """
+    Weighted logistic regressions for every row of `weights` at once.
+
+    Same objective as LogisticRegression(C=C) with an unpenalized
+    intercept: C * sum_i w_i logloss_i + ||coef||^2 / 2. Each Newton
+    (IRLS) iteration is one pass over the rows of X that accumulates every
+    replicate's objective, gradient and p x p Hessian per chunk; the
+    Newton systems are then solved together (see _solve_batch). A step
+    that increases a replicate's objective is halved on the next pass
+    (damping for separated or badly scaled designs). `init` (coefficients
+    followed by the intercept) seeds all replicates, e.g. with the
+    full-sample fit. Warns when some replicates have not converged after
+    `max_iter` passes.
+
+    Returns (coef, intercept, n_iter), coef of shape (rounds, p) and
+    intercept of shape (rounds,).
+    """
+
+    A = np.column_stack([X, np.ones(len(X))])
+    weights = np.atleast_2d(weights)
+    rounds, k = weights.shape[0], A.shape[1]
+
+    penalty = np.r_[np.ones(k - 1), 0.0]
+    beta = np.zeros((rounds, k))
+    if init is not None:
+        beta[:] = init
+
+    # Last accepted iterate of each replicate and the step taken from it
+    accepted = beta.copy()
+    accepted_objective = np.full(rounds, np.inf)
+    step = np.zeros((rounds, k))
+    converged = np.zeros(rounds, dtype=bool)
+
+    for n_iter in range(1, max_iter + 1):
+        objective = np.zeros(rounds)
+        gradient = np.zeros((rounds, k))
+        hessian = np.zeros((rounds, k * k))
+
+        for start in range(0, len(A), chunk_size):
+            rows = slice(start, start + chunk_size)
+            A_chunk = A[rows]
+            w_chunk = weights[:, rows].astype(float)
+
+            eta = beta @ A_chunk.T
+            p = expit(eta)
+
+            # Row-wise outer products a a', flattened to k*k columns
+            outer = (A_chunk[:, :, None] * A_chunk[:, None, :]).reshape(-1, k * k)
+
+            objective += (w_chunk * (np.logaddexp(0, eta) - y[rows] * eta)).sum(axis=1)
+            gradient += (w_chunk * (y[rows] - p)) @ A_chunk
+            hessian += (w_chunk * p * (1 - p)) @ outer
+
+        objective = C * objective + 0.5 * (penalty * beta**2).sum(axis=1)
+        gradient = C * gradient - penalty * beta
+        hessian = C * hessian.reshape(rounds, k, k) + np.diag(penalty)
+
+        # Damping: go back halfway along steps that increased the objective
+        rejected = ~converged & ~(
+            objective <= accepted_objective + 1e-12 * np.abs(accepted_objective)
+        )
+        step[rejected] /= 2
+        beta[rejected] = accepted[rejected] + step[rejected]
+        converged |= rejected & (np.max(np.abs(step), axis=1) < tol)
+        beta[converged] = accepted[converged]
+
+        update = ~converged & ~rejected
+        accepted[update] = beta[update]
+        accepted_objective[update] = objective[update]
+        step[update] = _solve_batch(hessian[update], gradient[update])
+        beta[update] += step[update]
+        converged |= update & (np.max(np.abs(step), axis=1) < tol)
+
+        if converged.all():
+            break
+
+    if not converged.all():
+        warnings.warn(
+            f"fit_logistic_batch: {np.sum(~converged)} of {rounds} replicates "
+            f"did not converge in {max_iter} iterations",
+            RuntimeWarning,
+        )
+
+    return beta[:, :-1], beta[:, -1], n_iter
+
+
+def _batch_propensity_scores(X, d, weights, chunk_size, seed_key=None):
+    """
+    Fit the propensity model of every replicate with fit_logistic_batch,
+    seeded by the full-sample fit, and yield (rows, scores) per chunk with
+    scores of shape (rounds, chunk).
+
+    With a `seed_key` (see _warm_start_seed) the full-sample fit is done
+    once per bootstrap run instead of once per batch.
+    """
+
+    def full_sample_fit():
+        coef, intercept, _ = fit_logistic_batch(
+            X, d, np.ones((1, len(X))), chunk_size=chunk_size
+        )
+        return np.r_[coef[0], intercept[0]]
+
+    if seed_key is None:
+        init = full_sample_fit()
+    else:
+        init = _warm_start_seed(seed_key + ("batch",), full_sample_fit)
+
+    coef, intercept, _ = fit_logistic_batch(
+        X, d, weights, init=init, chunk_size=chunk_size
+    )
+
+    for start in range(0, len(X), chunk_size):
+        rows = slice(start, start + chunk_size)
+        yield rows, expit(coef @ X[rows].T + intercept[:, None])
+
+
 # ------------------------------------
 # IPW estimator
 # ------------------------------------
-def ipw_estimator(df, model_exp="Z", treatment_var="D", outcome_var="Y"):
+def ipw_estimator(
+    df,
+    model_exp="Z",
+    treatment_var="D",
+    outcome_var="Y",
+    weights=None,
+    ps_key=None,
+):
     """
     Inverse Probability Weighting (IPW) estimator.
     """
 
+    X = design_matrix(model_exp, df, _data_key(ps_key, weights))
     propensity_score = (
-        LogisticRegression()
-        .fit(dmatrix(model_exp, df), df[treatment_var])
-        .predict_proba(dmatrix(model_exp, df))[:, 1]
+        fit_propensity_model(df, model_exp, treatment_var, weights, ps_key)
+        .predict_proba(X)[:, 1]
     )
 
-    return np.mean(
+    return _weighted_mean(
         df[outcome_var]
         * (df[treatment_var] - propensity_score)
-        / (propensity_score * (1 - propensity_score))
+        / (propensity_score * (1 - propensity_score)),
+        weights,
     )
 
 
+def ipw_batch_estimator(
+    df,
+    model_exp="Z",
+    treatment_var="D",
+    outcome_var="Y",
+    weights=None,
+    chunk_size=250_000,
+    ps_key=None,
+):
+    """
+    ipw_estimator for many bootstrap replicates at once.
+
+    weights: (rounds, n) matrix of per-row bootstrap weights. The
+    propensity models of all replicates are fitted together by
+    fit_logistic_batch. `ps_key` (data fingerprint, seed, weighting; see
+    bootstrap_batch) shares the full-sample seed fit across batches.
+    Returns an array with one ATE per replicate.
+    """
+
+    X = design_matrix(model_exp, df)
+    d = df[treatment_var].to_numpy(dtype=float)
+    y = df[outcome_var].to_numpy(dtype=float)
+    weights = np.ones((1, len(df))) if weights is None else np.atleast_2d(weights)
+
+    seed_key = None if ps_key is None else ps_key + (model_exp, treatment_var)
+
+    total = np.zeros(weights.shape[0])
+    for rows, ps in _batch_propensity_scores(X, d, weights, chunk_size, seed_key):
+        w_chunk = weights[:, rows].astype(float)
+        total += (w_chunk * y[rows] * (d[rows] - ps) / (ps * (1 - ps))).sum(axis=1)
+
+    return total / weights.sum(axis=1)
+
+
 # ------------------------------------
 # IPW stabilized estimator
 # ------------------------------------
-def ipw_stabilized_estimator(df, model_exp="Z", treatment_var="D", outcome_var="Y"):
+def ipw_stabilized_estimator(
+    df,
+    model_exp="Z",
+    treatment_var="D",
+    outcome_var="Y",
+    weights=None,
+    ps_key=None,
+):
     """
     Stabilized IPW estimator.
     """
 
-    prob_d = df[treatment_var].mean()
+    prob_d = _weighted_mean(df[treatment_var], weights)
 
-    ps_model = LogisticRegression().fit(
-        dmatrix(model_exp, df),
-        df[treatment_var],
-    )
+    ps_model = fit_propensity_model(df, model_exp, treatment_var, weights, ps_key)
 
-    df_control = df.loc[df[treatment_var] == 0]
-    df_treated = df.loc[df[treatment_var] == 1]
+    is_control = (df[treatment_var] == 0).to_numpy()
+    is_treated = (df[treatment_var] == 1).to_numpy()
+    df_control = df.loc[is_control]
+    df_treated = df.loc[is_treated]
 
-    ps_control = ps_model.predict_proba(dmatrix(model_exp, df_control))[:, 1]
-    ps_treated = ps_model.predict_proba(dmatrix(model_exp, df_treated))[:, 1]
+    X = design_matrix(model_exp, df, _data_key(ps_key, weights))
+    ps_control = ps_model.predict_proba(X[is_control])[:, 1]
+    ps_treated = ps_model.predict_proba(X[is_treated])[:, 1]
 
     weight_control = (1 - prob_d) / (1 - ps_control)
     weight_treated = prob_d / ps_treated
 
-    y1 = np.sum(df_treated[outcome_var] * weight_treated) / len(df_treated)
-    y0 = np.sum(df_control[outcome_var] * weight_control) / len(df_control)
+    if weights is None:
+        y1 = np.sum(df_treated[outcome_var] * weight_treated) / len(df_treated)
+        y0 = np.sum(df_control[outcome_var] * weight_control) / len(df_control)
+    else:
+        weights = np.asarray(weights)
+        y1 = _weighted_mean(
+            df_treated[outcome_var] * weight_treated, weights[is_treated]
+        )
+        y0 = _weighted_mean(
+            df_control[outcome_var] * weight_control, weights[is_control]
+        )
 
     return y1 - y0
 
@@ -148,21 +800,28 @@ def ipw_stabilized_estimator(df, model_exp="Z", treatment_var="D", outcome_var="
 # ------------------------------------
 # Propensity score linear regression
 # ------------------------------------
-def ps_linreg_estimator(df, model_exp="Z", treatment_var="D", outcome_var="Y"):
+def ps_linreg_estimator(
+    df,
+    model_exp="Z",
+    treatment_var="D",
+    outcome_var="Y",
+    weights=None,
+    ps_key=None,
+):
     """
     Linear regression adjusted by the estimated propensity score.
     """
 
+    X = design_matrix(model_exp, df, _data_key(ps_key, weights))
     propensity_score = (
-        LogisticRegression()
-        .fit(dmatrix(model_exp, df), df[treatment_var])
-        .predict_proba(dmatrix(model_exp, df))[:, 1]
+        fit_propensity_model(df, model_exp, treatment_var, weights, ps_key)
+        .predict_proba(X)[:, 1]
     )
 
     df_model = df.assign(propensity_score=propensity_score)
 
-    X = dmatrix(f"{treatment_var} + propensity_score", df_model)
-    model = LinearRegression().fit(X, df_model[outcome_var])
+    X = design_matrix(f"{treatment_var} + propensity_score", df_model)
+    model = LinearRegression().fit(X, df_model[outcome_var], sample_weight=weights)
 
     return model.coef_[1]
 
@@ -175,54 +834,343 @@ def ps_matching_estimator(
     model_exp="Z",
     treatment_var="D",
     outcome_var="Y",
-    n_jobs_knn=1,
+    n_neighbors=1,
+    caliper=None,
+    weights=None,
+    ps_key=None,
 ):
     """
     Nearest-neighbor matching on the propensity score.
+
+    Each unit is matched to the `n_neighbors` units of the other arm with
+    the closest score (see _match_outcomes): units with identical scores,
+    or at the same distance, are averaged rather than picked by row order.
+    With a `caliper`, only neighbors within that score distance are used
+    and units without any are left out of the average.
+
+    With bootstrap `weights`, each unit counts `weights` times both as a
+    neighbor and in the average, which gives the same matches as running
+    on the equivalent resampled frame.
     """
 
+    X = design_matrix(model_exp, df, _data_key(ps_key, weights))
     propensity_score = (
-        LogisticRegression()
-        .fit(dmatrix(model_exp, df), df[treatment_var])
-        .predict_proba(dmatrix(model_exp, df))[:, 1]
+        fit_propensity_model(df, model_exp, treatment_var, weights, ps_key)
+        .predict_proba(X)[:, 1]
     )
 
-    df_ps = df.assign(propensity_score=propensity_score)
-
-    treated = df_ps[df_ps[treatment_var] == 1].reset_index(drop=True)
-    control = df_ps[df_ps[treatment_var] == 0].reset_index(drop=True)
-
-    knn_treated = KNeighborsRegressor(
-        n_neighbors=1,
-        n_jobs=n_jobs_knn,
-    ).fit(treated[["propensity_score"]], treated[[outcome_var]])
-
-    knn_control = KNeighborsRegressor(
-        n_neighbors=1,
-        n_jobs=n_jobs_knn,
-    ).fit(control[["propensity_score"]], control[[outcome_var]])
-
-    matches = pd.concat(
-        [
-            treated.assign(
-                matched_outcome=knn_control.predict(treated[["propensity_score"]])
-            ),
-            control.assign(
-                matched_outcome=knn_treated.predict(control[["propensity_score"]])
-            ),
-        ]
+    d = df[treatment_var].to_numpy()
+    y = df[outcome_var].to_numpy(dtype=float)
+    w = np.ones(len(df)) if weights is None else np.asarray(weights, dtype=float)
+
+    treated = d == 1
+    control = d == 0
+
+    matched_outcome = np.full(len(df), np.nan)
+    matched_outcome[treated] = _match_outcomes(
+        propensity_score[treated],
+        propensity_score[control], y[control], w[control],
+        n_neighbors, caliper,
     )
+    matched_outcome[control] = _match_outcomes(
+        propensity_score[control],
+        propensity_score[treated], y[treated], w[treated],
+        n_neighbors, caliper,
+    )
+
+    effect = np.where(treated, y - matched_outcome, matched_outcome - y)
+    matched = (treated | control) & ~np.isnan(matched_outcome) & (w > 0)
+
+    ate = _weighted_mean(
+        effect[matched],
+        None if weights is None else w[matched],
+    )
+
+    return ate
+
+
+def _match_outcomes(query, score, outcome, weight, n_neighbors=1, caliper=None):
+    """
+    Mean outcome of the `n_neighbors` pool units nearest to each query
+    score (1-D), NaN where no pool unit lies within `caliper`.
+
+    The pool is sorted once and units with identical scores are collapsed
+    into groups (total weight, weighted outcome sum). Each query starts
+    from its np.searchsorted position and takes groups outward, nearest
+    first; a group taken only in part contributes its mean outcome, and
+    equidistant groups on both sides are taken together. A unit of weight
+    w counts as w neighbors.
+    """
+
+    keep = weight > 0
+    order = np.argsort(score[keep], kind="stable")
+    pool_score = score[keep][order]
+    pool_weight = weight[keep][order]
+    pool_total = pool_weight * outcome[keep][order]
+
+    groups, group_start = np.unique(pool_score, return_index=True)
+    if len(groups) == 0:
+        return np.full(len(query), np.nan)
+
+    count = np.add.reduceat(pool_weight, group_start)
+    total = np.add.reduceat(pool_total, group_start)
+    last = len(groups) - 1
+    max_distance = np.inf if caliper is None else caliper
+
+    # Queries in score order keep the lookups below cache friendly
+    query_order = np.argsort(query, kind="stable")
+    query = query[query_order]
 
-    ate = np.mean(
-        matches[treatment_var]
-        * (matches[outcome_var] - matches["matched_outcome"])
-        + (1 - matches[treatment_var])
-        * (matches["matched_outcome"] - matches[outcome_var])
+    right = np.searchsorted(groups, query)
+    left = right - 1
+    need = np.full(len(query), float(n_neighbors))
+    taken = np.zeros(len(query))
+    outcome_sum = np.zeros(len(query))
+
+    todo = np.arange(len(query))
+    while len(todo):
+        q, l, r = query[todo], left[todo], right[todo]
+
+        dist_left = np.where(l >= 0, q - groups[np.maximum(l, 0)], np.inf)
+        dist_right = np.where(r <= last, groups[np.minimum(r, last)] - q, np.inf)
+        nearest = np.minimum(dist_left, dist_right)
+
+        active = np.isfinite(nearest) & (nearest <= max_distance)
+        todo, l, r = todo[active], l[active], r[active]
+        dist_left, dist_right = dist_left[active], dist_right[active]
+
+        from_left = dist_left <= dist_right
+        from_right = dist_right <= dist_left
+        l_index, r_index = np.maximum(l, 0), np.minimum(r, last)
+
+        n = (
+            np.where(from_left, count[l_index], 0)
+            + np.where(from_right, count[r_index], 0)
+        )
+        s = (
+            np.where(from_left, total[l_index], 0)
+            + np.where(from_right, total[r_index], 0)
+        )
+
+        used = np.minimum(need[todo], n)
+        outcome_sum[todo] += used * s / n
+        taken[todo] += used
+        need[todo] -= used
+
+        left[todo] -= from_left
+        right[todo] += from_right
+        todo = todo[need[todo] > 0]
+
+    matched_outcome = np.empty(len(query))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        matched_outcome[query_order] = np.where(
+            taken > 0, outcome_sum / taken, np.nan
+        )
+
+    return matched_outcome
+
+
+# ------------------------------------
+# Covariate matching
+# ------------------------------------
+# Indexes built on the full frame, reused by weighted bootstrap rounds
+_match_indexes = {}
+_MATCH_INDEX_CACHE_SIZE = 4
+
+
+def covariate_matching_estimator(
+    df,
+    covariates=("Z", "W"),
+    treatment_var="D",
+    outcome_var="Y",
+    metric="mahalanobis",
+    n_neighbors=1,
+    eps=0.0,
+    n_jobs=1,
+    batch_size=100_000,
+    weights=None,
+    ps_key=None,
+):
+    """
+    Nearest-neighbor matching on several covariates.
+
+    Distances are Mahalanobis (metric="mahalanobis") or standardized
+    Euclidean (metric="standardized") on `covariates`. Each unit is
+    matched to the `n_neighbors` closest units of the other arm; units
+    with identical covariates are averaged, as in ps_matching_estimator.
+
+    Each arm is indexed once by a KD-tree over its distinct covariate
+    rows (see build_match_index). Queries run in batches of `batch_size`
+    rows on `n_jobs` threads, and `eps` > 0 allows approximate
+    neighbors, each within (1 + eps) times the true distance.
+
+    With bootstrap `weights` and a `ps_key` (see bootstrap_many), the
+    index of the full frame is cached and every round only re-weights
+    the tree's points instead of rebuilding it. The distance transform
+    then comes from the full sample rather than from the replicate.
+    """
+
+    if weights is None or ps_key is None:
+        index = build_match_index(df, covariates, treatment_var, metric)
+    else:
+        key = (ps_key[0], tuple(covariates), treatment_var, metric)
+        if key not in _match_indexes:
+            if len(_match_indexes) >= _MATCH_INDEX_CACHE_SIZE:
+                _match_indexes.pop(next(iter(_match_indexes)))
+            _match_indexes[key] = build_match_index(
+                df, covariates, treatment_var, metric
+            )
+        index = _match_indexes[key]
+
+    y = df[outcome_var].to_numpy(dtype=float)
+    w = np.ones(len(df)) if weights is None else np.asarray(weights, dtype=float)
+
+    # Per-point (distinct covariate row) weight and weighted outcome sum
+    arms = {}
+    for arm in (0, 1):
+        rows = index[arm]["rows"]
+        point = index[arm]["point"]
+        n_points = len(index[arm]["tree"].data)
+        arms[arm] = (
+            np.bincount(point, weights=w[rows], minlength=n_points),
+            np.bincount(point, weights=w[rows] * y[rows], minlength=n_points),
+        )
+
+    matched_outcome = np.full(len(df), np.nan)
+    for arm in (0, 1):
+        pool = 1 - arm
+        point_outcome = _match_points(
+            index[arm]["tree"].data,
+            index[pool]["tree"],
+            *arms[pool],
+            n_neighbors, eps, n_jobs, batch_size,
+        )
+        matched_outcome[index[arm]["rows"]] = point_outcome[index[arm]["point"]]
+
+    treated = (df[treatment_var] == 1).to_numpy()
+    effect = np.where(treated, y - matched_outcome, matched_outcome - y)
+    matched = ~np.isnan(matched_outcome) & (w > 0)
+
+    ate = _weighted_mean(
+        effect[matched],
+        None if weights is None else w[matched],
     )
 
     return ate
 
 
+def build_match_index(df, covariates, treatment_var="D", metric="mahalanobis"):
+    """
+    Matching index of both arms: {arm: {"tree", "rows", "point"}}.
+
+    Covariates are whitened (Cholesky of the pooled covariance for
+    "mahalanobis", per-column standard deviation for "standardized") so
+    that Euclidean distance in the tree is the requested metric. Each
+    arm's tree holds its distinct whitened rows; `rows` are the arm's row
+    positions in `df` and `point` the tree point of each of them.
+    """
+
+    X = df[list(covariates)].to_numpy(dtype=float)
+
+    if metric == "mahalanobis":
+        cov = np.atleast_2d(np.cov(X, rowvar=False))
+        X = np.linalg.solve(np.linalg.cholesky(cov), (X - X.mean(axis=0)).T).T
+    elif metric == "standardized":
+        X = (X - X.mean(axis=0)) / X.std(axis=0)
+    else:
+        raise ValueError(f"unknown metric {metric!r}")
+
+    d = df[treatment_var].to_numpy()
+
+    index = {}
+    for arm in (0, 1):
+        rows = np.flatnonzero(d == arm)
+        point, first = _distinct_rows(X[rows])
+        index[arm] = {
+            "tree": cKDTree(X[rows][first]),
+            "rows": rows,
+            "point": point,
+        }
+
+    return index
+
+
+def clear_match_index_cache():
+    """
+    Drop the cached covariate matching indexes.
+    """
+
+    _match_indexes.clear()
+
+
+def _distinct_rows(X):
+    """
+    Id of the distinct row of each row of X (hashed, in order of first
+    appearance) and the position of each distinct row's first occurrence.
+    """
+
+    point = (
+        pd.DataFrame(X)
+        .groupby(list(range(X.shape[1])), sort=False, dropna=False)
+        .ngroup()
+        .to_numpy()
+    )
+    _, first = np.unique(point, return_index=True)
+
+    return point, first
+
+
+def _match_points(query, tree, count, total, n_neighbors, eps, n_jobs, batch_size):
+    """
+    Mean outcome of the `n_neighbors` nearest units for each query point.
+
+    Tree points carry a weight `count` and a weighted outcome sum `total`
+    and are taken nearest first until `n_neighbors` units are collected,
+    the last one possibly in part; zero-weight points are skipped. Points
+    are queried `k` at a time, doubling `k` for the queries that have not
+    collected enough units yet. NaN when the pool is empty.
+    """
+
+    n_points = len(tree.data)
+
+    # Sentinel for missing neighbors (index n_points, infinite distance)
+    count = np.append(count, 0)
+    total = np.append(total, 0)
+    mean = np.divide(total, count, out=np.zeros_like(total), where=count > 0)
+
+    matched_outcome = np.full(len(query), np.nan)
+    if count.sum() == 0:
+        return matched_outcome
+
+    for start in range(0, len(query), batch_size):
+        todo = np.arange(start, min(start + batch_size, len(query)))
+        k = n_neighbors
+
+        while len(todo):
+            k = min(k, n_points)
+            _, neighbor = tree.query(
+                query[todo], k=k, eps=eps, workers=n_jobs
+            )
+            neighbor = neighbor.reshape(len(todo), k)
+
+            available = count[neighbor]
+            before = np.cumsum(available, axis=1) - available
+            used = np.clip(n_neighbors - before, 0, available)
+
+            taken = used.sum(axis=1)
+            done = (taken >= n_neighbors) | (k == n_points)
+
+            with np.errstate(invalid="ignore"):
+                matched_outcome[todo[done]] = (
+                    (used * mean[neighbor]).sum(axis=1) / taken
+                )[done]
+
+            todo = todo[~done]
+            k *= 2
+
+    return matched_outcome
+
+
 # ------------------------------------
 # Double robust estimator
 # ------------------------------------
@@ -232,41 +1180,102 @@ def double_robust_estimator(
     ps_model_exp="Z",
     treatment_var="D",
     outcome_var="Y",
+    weights=None,
+    ps_key=None,
 ):
     """
     Doubly robust ATE estimator.
     """
 
-    df_control = df.loc[df[treatment_var] == 0]
+    data_key = _data_key(ps_key, weights)
+    X = design_matrix(linreg_model_exp, df, data_key)
+    y = df[outcome_var].to_numpy()
+
+    is_control = (df[treatment_var] == 0).to_numpy()
     control_model = LinearRegression().fit(
-        dmatrix(linreg_model_exp, df_control),
-        df_control[outcome_var],
+        X[is_control],
+        y[is_control],
+        sample_weight=None if weights is None else np.asarray(weights)[is_control],
     )
 
-    df_treated = df.loc[df[treatment_var] == 1]
+    is_treated = (df[treatment_var] == 1).to_numpy()
     treated_model = LinearRegression().fit(
-        dmatrix(linreg_model_exp, df_treated),
-        df_treated[outcome_var],
+        X[is_treated],
+        y[is_treated],
+        sample_weight=None if weights is None else np.asarray(weights)[is_treated],
     )
 
     propensity_score = (
-        LogisticRegression()
-        .fit(dmatrix(ps_model_exp, df), df[treatment_var])
-        .predict_proba(dmatrix(ps_model_exp, df))[:, 1]
+        fit_propensity_model(df, ps_model_exp, treatment_var, weights, ps_key)
+        .predict_proba(design_matrix(ps_model_exp, df, data_key))[:, 1]
     )
 
-    treated_mean = np.mean(
-        treated_model.predict(dmatrix(linreg_model_exp, df))
-        + (df[outcome_var] - treated_model.predict(dmatrix(linreg_model_exp, df)))
+    treated_prediction = treated_model.predict(X)
+    control_prediction = control_model.predict(X)
+
+    treated_mean = _weighted_mean(
+        treated_prediction
+        + (df[outcome_var] - treated_prediction)
         * df[treatment_var]
-        / propensity_score
+        / propensity_score,
+        weights,
     )
 
-    untreated_mean = np.mean(
-        control_model.predict(dmatrix(linreg_model_exp, df))
-        + (df[outcome_var] - control_model.predict(dmatrix(linreg_model_exp, df)))
+    untreated_mean = _weighted_mean(
+        control_prediction
+        + (df[outcome_var] - control_prediction)
         * (1 - df[treatment_var])
-        / (1 - propensity_score)
+        / (1 - propensity_score),
+        weights,
     )
 
     return treated_mean - untreated_mean
+
+
+def double_robust_batch_estimator(
+    df,
+    linreg_model_exp="W",
+    ps_model_exp="Z",
+    treatment_var="D",
+    outcome_var="Y",
+    weights=None,
+    chunk_size=250_000,
+    ps_key=None,
+):
+    """
+    double_robust_estimator for many bootstrap replicates at once.
+
+    weights: (rounds, n) matrix of per-row bootstrap weights. The outcome
+    regressions of both arms are solved from batched weighted normal
+    equations and the propensity models by fit_logistic_batch, as in
+    ipw_batch_estimator. Returns an array with one ATE per replicate.
+    """
+
+    X_lin = design_matrix(linreg_model_exp, df)
+    X_ps = design_matrix(ps_model_exp, df)
+    d = df[treatment_var].to_numpy(dtype=float)
+    y = df[outcome_var].to_numpy(dtype=float)
+    weights = np.ones((1, len(df))) if weights is None else np.atleast_2d(weights)
+
+    beta = {}
+    for arm in (0, 1):
+        XtWX, XtWy = _weighted_normal_equations(
+            X_lin, y, weights, chunk_size, mask=d == arm
+        )
+        beta[arm] = _solve_batch(XtWX, XtWy)
+
+    seed_key = None if ps_key is None else ps_key + (ps_model_exp, treatment_var)
+
+    treated_total = np.zeros(weights.shape[0])
+    untreated_total = np.zeros(weights.shape[0])
+    for rows, ps in _batch_propensity_scores(X_ps, d, weights, chunk_size, seed_key):
+        w_chunk = weights[:, rows].astype(float)
+        mu1 = beta[1] @ X_lin[rows].T
+        mu0 = beta[0] @ X_lin[rows].T
+
+        treated_total += (w_chunk * (mu1 + (y[rows] - mu1) * d[rows] / ps)).sum(axis=1)
+        untreated_total += (
+            w_chunk * (mu0 + (y[rows] - mu0) * (1 - d[rows]) / (1 - ps))
+        ).sum(axis=1)
+
+    return (treated_total - untreated_total) / weights.sum(axis=1)
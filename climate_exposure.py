@@ -0,0 +1,159 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+
+# ------------------------------------
+# Reading
+# ------------------------------------
+def read_climate_files(folder, columns = None, n_threads = 8):
+    """
+    Read every .parquet file of `folder` into one DataFrame.
+
+    Only `columns` are decoded (all when None). Each file is a fragment of
+    a pyarrow dataset and fragments are read concurrently by a thread
+    pool; the tables are concatenated in filename order, with column types
+    promoted across files, before a single conversion to pandas.
+    """
+
+    files = sorted(
+        os.path.join(folder, filename)
+        for filename in os.listdir(folder)
+        if filename.endswith(".parquet")
+    )
+
+    dataset = ds.dataset(files, format = "parquet")
+
+    def read_fragment(fragment):
+        return fragment.to_table(columns = columns, use_threads = False)
+
+    with ThreadPoolExecutor(max_workers = n_threads) as pool:
+        tables = list(pool.map(read_fragment, dataset.get_fragments()))
+
+    # Yearly files may store a column with different types (e.g. float
+    # and double); promote them to a common type as pd.concat would
+    return pa.concat_tables(tables, promote_options = "permissive").to_pandas()
+
+
+# ------------------------------------
+# Heat-event flagging
+# ------------------------------------
+def flag_heat_events(
+    df,
+    window_size,
+    temperature_threshold,
+    min_days,
+    date_col,
+    city_col,
+    temperature_col,
+):
+    """
+    Flag heat events for all municipalities in one pass.
+
+    Same rule as a per-municipality rolling count: a day is a heat event
+    when at least `min_days` of the previous `window_size` rows (days) of
+    the same municipality, excluding the day itself, had temperature
+    above `temperature_threshold`. The frame is sorted once by
+    (city, date) and the windowed counts are differences of a single
+    cumulative sum, clipped at each municipality's first row.
+    """
+
+    df = _sort_by_city_date(df, date_col, city_col, temperature_col)
+    group_start = _group_start(df[city_col])
+
+    heat = (df[temperature_col] > temperature_threshold).to_numpy()
+    n_hot = _hot_day_counts(heat, group_start, window_size)
+
+    # The first day of a municipality has no history
+    df["heat_event"] = (n_hot >= min_days) & (np.arange(len(df)) > group_start)
+
+    return df
+
+
+def heat_exposure_table(
+    df,
+    thresholds,
+    window_sizes,
+    date_col,
+    city_col,
+    temperature_col,
+):
+    """
+    Hot-day counts for a grid of temperature thresholds and window
+    lengths, computed in a single scan of the sorted frame.
+
+    One cumulative sum is taken per threshold and every window length is
+    read off it, giving one int16 column per (threshold, window) named by
+    exposure_column. Use select_heat_event to turn a column into the
+    heat_event flag of one exposure definition.
+    """
+
+    df = _sort_by_city_date(df, date_col, city_col, temperature_col)
+    group_start = _group_start(df[city_col])
+    temperature = df[temperature_col].to_numpy()
+
+    for threshold in thresholds:
+        heat = temperature > threshold
+        for window_size in window_sizes:
+            df[exposure_column(threshold, window_size)] = _hot_day_counts(
+                heat, group_start, window_size
+            ).astype(np.int16)
+
+    return df
+
+
+def exposure_column(threshold, window_size):
+    """
+    Name of the hot-day count column for one exposure definition.
+    """
+
+    return f"n_hot_t{threshold:g}_w{window_size}"
+
+
+def select_heat_event(table, threshold, window_size, min_days):
+    """
+    heat_event flag of one (threshold, window, min_days) definition from
+    a heat_exposure_table (min_days must be positive).
+    """
+
+    if min_days < 1:
+        raise ValueError("min_days must be at least 1")
+
+    return table[exposure_column(threshold, window_size)] >= min_days
+
+
+def _sort_by_city_date(df, date_col, city_col, temperature_col):
+    """
+    Working copy of the needed columns, sorted by (city, date).
+    """
+
+    return df[[city_col, date_col, temperature_col]].sort_values(
+        [city_col, date_col], kind="stable", ignore_index=True
+    )
+
+
+def _group_start(city):
+    """
+    Position of the first row of each row's municipality (frame sorted
+    by municipality).
+    """
+
+    codes = pd.factorize(city)[0]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+
+    return np.repeat(starts, np.diff(np.r_[starts, len(codes)]))
+
+
+def _hot_day_counts(heat, group_start, window_size):
+    """
+    Hot days in rows [max(group_start, i - window_size), i) for each row
+    i, as differences of one cumulative sum.
+    """
+
+    idx = np.arange(len(heat))
+    prefix = np.r_[0, np.cumsum(heat, dtype=np.int64)]
+
+    return prefix[idx] - prefix[np.maximum(group_start, idx - window_size)]
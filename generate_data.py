@@ -1,31 +1,38 @@
 import pandas as pd
 import numpy as np
-import scipy.stats as stats
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-def generate_data_discrete(n = 1000, true_ATE = 2.0):
+def generate_data_discrete(n = 1000, true_ATE = 2.0, rng = None):
     """
     Generate synthetic data with a discrete confounder Z.
     n: int, number of samples
     true_ATE: float, true causal effect of D on Y
+    rng: np.random.Generator (a fresh one if None)
     """
+    rng = np.random.default_rng(rng)
+
     # Discrete confounder Z ∈ {0, 1, 2}
-    Z = stats.randint.rvs(low = 0, high = 3, size = n)
+    Z = rng.integers(low = 0, high = 3, size = n)
 
     # W depends on Z (categorical 3,4).
-    transition = {
-        0: [0.7, 0.3],
-        1: [0.4, 0.6],
-        2: [0.1, 0.9],
-    }
-    W = np.array([np.random.choice([3,4], p=transition[z]) for z in Z])
+    transition = np.array([
+        [0.7, 0.3],
+        [0.4, 0.6],
+        [0.1, 0.9],
+    ])
+
+    # Uniform draw against P(W = 3 | Z), looked up per row
+    p_w3 = transition[Z, 0]
+    W = np.where(rng.random(n) < p_w3, 3, 4)
 
     # Treatment assignment depends on Z
     alpha_z = np.array([0.25, 0.5, 0.7]) 
     p_treat = alpha_z[Z]
-    D = np.random.binomial(1, p_treat, size=n)
+    D = rng.binomial(1, p_treat, size=n)
 
     # outcome depends on D and W plus noise
-    noise = np.random.normal(0,1,size = n)
+    noise = rng.normal(0,1,size = n)
     coef_W = 3
     Y = 1.5 + true_ATE*D + coef_W*W + noise
 
@@ -40,26 +47,29 @@ def generate_data_discrete(n = 1000, true_ATE = 2.0):
     return df, true_ATE
 
 
-def generate_data_continuous(n = 1000, true_ATE = 2.0):
+def generate_data_continuous(n = 1000, true_ATE = 2.0, rng = None):
     """
     Generate synthetic data with a continuous confounder Z.
     n: int, number of samples
     true_ATE: float, true causal effect of D on Y
+    rng: np.random.Generator (a fresh one if None)
     """
+    rng = np.random.default_rng(rng)
+
     # Continuous confounder Z
-    Z = np.random.normal(0, 0.5, size=n)
+    Z = rng.normal(0, 0.5, size=n)
 
     # W depends on Z 
     p_w = 1 / (1 + np.exp(-Z))   
-    W = np.random.binomial(1, p_w, size=n)+3
+    W = rng.binomial(1, p_w, size=n)+3
 
     # Treatment assignment depends on Z
     logits = -2.5 + 2.4*Z 
     p_treat = 1 / (1 + np.exp(-logits))
-    D = np.random.binomial(1, p_treat, size=n)
+    D = rng.binomial(1, p_treat, size=n)
 
     # Outcome depends on treatment, W, and noise
-    noise = np.random.normal(0,1,size = n)
+    noise = rng.normal(0,1,size = n)
     coef_W = 3
     Y = 1.5 + true_ATE*D + coef_W*W + noise
 
@@ -73,3 +83,41 @@ def generate_data_continuous(n = 1000, true_ATE = 2.0):
 
     return df, true_ATE
 
+
+def generate_data_chunks(generator, n, chunk_size = 1_000_000, seed = None, **kwargs):
+    """
+    Yield the data of `generator` (e.g. generate_data_discrete) in blocks
+    of at most chunk_size rows, for sizes that do not fit in memory.
+    n: int, total number of samples
+    seed: block j draws from SeedSequence(seed).spawn(...)[j], so blocks
+          are independent streams and reproducible for a given chunk_size
+    """
+    entropy = np.random.SeedSequence(seed).entropy
+
+    for j, start in enumerate(range(0, n, chunk_size)):
+        rng = np.random.default_rng(np.random.SeedSequence(entropy, spawn_key = (j,)))
+        df, _ = generator(n = min(chunk_size, n - start), rng = rng, **kwargs)
+        yield df
+
+
+def write_data_chunks(chunks, path):
+    """
+    Write DataFrame blocks to a single parquet file, one row group per
+    block, holding only one block in memory at a time.
+    Returns the number of rows written.
+    """
+    writer = None
+    n_rows = 0
+
+    try:
+        for df in chunks:
+            table = pa.Table.from_pandas(df, preserve_index = False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table, row_group_size = len(df))
+            n_rows += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return n_rows
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from aux_functions import (
+    bootstrap,
+    load_shared_frame,
+    release_shared_frame,
+    share_frame,
+)
+from causal_estimators import adjustment_formula_estimator
+
+
+def mixed_frame(n=200, seed=3):
+    rng = np.random.default_rng(seed)
+    S = rng.choice(["a", "b", "c"], n)
+    D = rng.integers(0, 2, n)
+
+    return pd.DataFrame(
+        {
+            "S": S,
+            "S_cat": pd.Categorical(S),
+            "K": pd.array(np.where(rng.random(n) < 0.1, None, rng.integers(0, 9, n)), dtype="Int16"),
+            "T": pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 365, n), "D"),
+            "D": D,
+            "Y": D + (S == "a") + rng.normal(size=n),
+            "flag": rng.random(n) < 0.5,
+        },
+        index=pd.RangeIndex(100, 100 + 2 * n, 2),
+    )
+
+
+def test_shared_frame_round_trips_non_numeric_columns():
+    df = mixed_frame()
+
+    handle = share_frame(df)
+    try:
+        pd.testing.assert_frame_equal(load_shared_frame(handle).copy(), df)
+    finally:
+        release_shared_frame(handle)
+
+
+def test_bootstrap_with_string_strata_does_not_depend_on_n_jobs():
+    df = mixed_frame()
+
+    serial = bootstrap(df, adjustment_formula_estimator, n_jobs=1, rounds=6, adjustment_set=["S"])
+    parallel = bootstrap(df, adjustment_formula_estimator, n_jobs=2, rounds=6, adjustment_set=["S"])
+
+    assert serial[0] == parallel[0]
+    np.testing.assert_array_equal(serial[1], parallel[1])
@@ -0,0 +1,303 @@
+import numpy as np
+import pandas as pd
+import pytest
+from patsy import dmatrix
+from sklearn.neighbors import KNeighborsRegressor
+
+import causal_estimators
+from aux_functions import bootstrap_batch, bootstrap_many, iter_row_groups
+from causal_estimators import (
+    _match_outcomes,
+    adjustment_formula_estimator,
+    adjustment_formula_streaming_estimator,
+    clear_design_cache,
+    clear_ps_cache,
+    design_matrix,
+    double_robust_batch_estimator,
+    fit_logistic_batch,
+    fit_propensity_model,
+    ipw_batch_estimator,
+    ipw_estimator,
+    linreg_causal_estimator,
+    linreg_causal_streaming_estimator,
+    naive_estimator,
+    naive_streaming_estimator,
+    ps_cache_info,
+    ps_matching_estimator,
+)
+from generate_data import write_data_chunks
+
+
+def simulated_data(n=2_000, seed=7):
+    rng = np.random.default_rng(seed)
+    Z = rng.normal(size=n)
+    D = (rng.random(n) < 1 / (1 + np.exp(-0.8 * Z))).astype(int)
+    Y = 1.5 * D + Z + rng.normal(size=n)
+
+    return pd.DataFrame({"Z": Z, "D": D, "Y": Y})
+
+
+@pytest.mark.parametrize("weighting", [None, "multinomial"])
+def test_bootstrap_many_ps_estimates_do_not_depend_on_n_jobs(weighting):
+    df = simulated_data()
+    estimators = {"ipw": (ipw_estimator, {})}
+
+    clear_ps_cache()
+    _, serial = bootstrap_many(
+        df, estimators, n_jobs=1, rounds=8, weighting=weighting, return_replicates=True
+    )
+    _, parallel = bootstrap_many(
+        df, estimators, n_jobs=2, rounds=8, weighting=weighting, return_replicates=True
+    )
+
+    pd.testing.assert_frame_equal(serial, parallel)
+
+
+@pytest.mark.parametrize("weighting", [None, "multinomial"])
+def test_bootstrap_many_ps_estimates_do_not_depend_on_earlier_runs(weighting):
+    df = simulated_data()
+    estimators = {"ipw": (ipw_estimator, {})}
+
+    def run(data, seed=1944):
+        return bootstrap_many(
+            data, estimators, n_jobs=1, rounds=4, seed=seed,
+            weighting=weighting, return_replicates=True,
+        )[1]
+
+    clear_ps_cache()
+    first = run(df)
+
+    clear_ps_cache()
+    run(simulated_data(seed=8))
+    run(df, seed=2024)
+    again = run(df)
+
+    pd.testing.assert_frame_equal(first, again)
+
+
+def test_bootstrap_many_keeps_one_warm_start_seed_per_formula():
+    df = simulated_data()
+    df["W"] = df["Z"] ** 2
+    estimators = {
+        "ipw_z": (ipw_estimator, {"model_exp": "Z"}),
+        "ipw_zw": (ipw_estimator, {"model_exp": "Z + W"}),
+    }
+
+    clear_ps_cache()
+    bootstrap_many(df, estimators, n_jobs=1, rounds=5, weighting="multinomial")
+    info = ps_cache_info()
+
+    # one cold full-sample seed per formula, every replicate warm-started
+    assert info["fits"] == 2
+    assert info["warm_fits"] == 10
+
+
+def test_ps_model_cache_keeps_only_the_current_round():
+    df = simulated_data()
+    df["W"] = df["Z"] ** 2
+    estimators = {
+        "ipw": (ipw_estimator, {"model_exp": "Z"}),
+        "ipw_zw": (ipw_estimator, {"model_exp": "Z + W"}),
+        "ipw_again": (ipw_estimator, {"model_exp": "Z"}),
+    }
+
+    clear_ps_cache()
+    bootstrap_many(df, estimators, n_jobs=1, rounds=5)
+    info = ps_cache_info()
+
+    assert info["size"] == 2
+    assert (info["hits"], info["misses"]) == (5, 10)
+
+
+def test_fit_logistic_batch_warns_and_stays_finite_on_separated_data():
+    X = np.r_[-np.arange(1, 51), np.arange(1, 51)][:, None] * 10.0
+    y = (X[:, 0] > 0).astype(float)
+
+    with pytest.warns(RuntimeWarning, match="did not converge"):
+        coef, intercept, n_iter = fit_logistic_batch(
+            X, y, np.ones((2, len(X))), C=1e6, max_iter=5
+        )
+
+    assert n_iter == 5
+    assert np.isfinite(coef).all() and np.isfinite(intercept).all()
+
+
+def test_fit_logistic_batch_solves_singular_replicates():
+    df = simulated_data()
+    X = np.column_stack([df["Z"], df["Z"]])
+    weights = np.ones((2, len(df)))
+    weights[1] = 0
+
+    coef, intercept, _ = fit_logistic_batch(X, df["D"].to_numpy(dtype=float), weights)
+
+    assert np.isfinite(coef).all()
+    np.testing.assert_allclose(coef[0, 0], coef[0, 1])
+    np.testing.assert_array_equal(coef[1], 0)
+
+
+@pytest.mark.parametrize("formula", ["C(Z)", "center(Z) + W"])
+def test_design_matrix_learns_levels_and_transforms_per_frame(formula):
+    first = pd.DataFrame({"Z": [1, 2, 3, 1, 2, 3], "W": [0.5, 1, 2, 3, 5, 8]})
+    second = pd.DataFrame({"Z": [3, 4, 5, 4, 9, 9], "W": [1, 1, 2, 2, 3, 3]})
+    subset = first.iloc[[1, 2, 4]]
+
+    clear_design_cache()
+    for df in (first, second, subset):
+        np.testing.assert_array_equal(
+            design_matrix(formula, df), np.asarray(dmatrix(formula, df))
+        )
+
+
+def test_streaming_estimators_match_in_memory_versions(tmp_path):
+    blocks = []
+    for seed in range(4):
+        block = simulated_data(n=500, seed=seed)
+        block["S"] = np.digitize(block["Z"], [-1, 0, 1])
+        blocks.append(block)
+    # a stratum missing from later blocks (the first block fixes the
+    # levels of C(S) in the streaming regression)
+    blocks[0].loc[:9, "S"] = 9
+
+    path = tmp_path / "blocks.parquet"
+    assert write_data_chunks(iter(blocks), path) == 2_000
+    df = pd.concat(list(iter_row_groups(path)), ignore_index=True)
+    pd.testing.assert_frame_equal(df, pd.concat(blocks, ignore_index=True))
+
+    np.testing.assert_allclose(
+        naive_streaming_estimator(iter_row_groups(path)), naive_estimator(df)
+    )
+    np.testing.assert_allclose(
+        adjustment_formula_streaming_estimator(iter_row_groups(path), ["S"]),
+        adjustment_formula_estimator(df, ["S"]),
+    )
+    for formula in ["D + Z", "D + C(S)"]:
+        np.testing.assert_allclose(
+            linreg_causal_streaming_estimator(iter_row_groups(path), formula),
+            linreg_causal_estimator(df, formula),
+        )
+
+
+@pytest.mark.parametrize("estimator", [ipw_batch_estimator, double_robust_batch_estimator])
+def test_bootstrap_batch_fits_the_propensity_seed_once(monkeypatch, estimator):
+    df = simulated_data()
+    df["W"] = df["Z"]
+
+    def run(**kwargs):
+        return bootstrap_batch(df, estimator, rounds=10, batch_size=2, **kwargs)
+
+    clear_ps_cache()
+    fits = []
+    fit = causal_estimators.fit_logistic_batch
+    monkeypatch.setattr(
+        causal_estimators,
+        "fit_logistic_batch",
+        lambda X, y, weights, **kwargs: fits.append(len(weights)) or fit(X, y, weights, **kwargs),
+    )
+    shared = run()
+
+    # one full-sample seed fit, then one fit per batch of 2 replicates
+    assert fits == [1] + [2] * 5
+
+    # same estimates as fitting the seed in every batch
+    fits.clear()
+    per_batch = run(ps_key=None)
+    assert fits == [1, 2] * 5
+    np.testing.assert_array_equal(shared[0], per_batch[0])
+    np.testing.assert_array_equal(shared[1], per_batch[1])
+
+
+def legacy_ps_matching_estimator(df, model_exp="Z", treatment_var="D", outcome_var="Y"):
+    """
+    The KNeighborsRegressor matcher that ps_matching_estimator replaced
+    (unweighted, 1-NN).
+    """
+
+    propensity_score = (
+        fit_propensity_model(df, model_exp, treatment_var)
+        .predict_proba(dmatrix(model_exp, df))[:, 1]
+    )
+    df_ps = df.assign(propensity_score=propensity_score)
+
+    treated = df_ps[df_ps[treatment_var] == 1].reset_index(drop=True)
+    control = df_ps[df_ps[treatment_var] == 0].reset_index(drop=True)
+
+    knn_treated = KNeighborsRegressor(n_neighbors=1).fit(
+        treated[["propensity_score"]], treated[[outcome_var]]
+    )
+    knn_control = KNeighborsRegressor(n_neighbors=1).fit(
+        control[["propensity_score"]], control[[outcome_var]]
+    )
+
+    matches = pd.concat(
+        [
+            treated.assign(
+                matched_outcome=knn_control.predict(treated[["propensity_score"]])[:, 0]
+            ),
+            control.assign(
+                matched_outcome=knn_treated.predict(control[["propensity_score"]])[:, 0]
+            ),
+        ]
+    )
+
+    return np.mean(
+        matches[treatment_var] * (matches[outcome_var] - matches["matched_outcome"])
+        + (1 - matches[treatment_var]) * (matches["matched_outcome"] - matches[outcome_var])
+    )
+
+
+def test_ps_matching_matches_legacy_knn_on_continuous_scores():
+    df = simulated_data(n=3_000, seed=11)
+
+    np.testing.assert_allclose(
+        ps_matching_estimator(df), legacy_ps_matching_estimator(df), rtol=1e-12
+    )
+
+
+def test_ps_matching_weights_match_the_resampled_frame():
+    df = simulated_data(n=1_000, seed=5)
+    df["Z"] = np.round(df["Z"], 1)  # tied scores, some far from the other arm
+    rng = np.random.default_rng(0)
+    idx = rng.integers(0, len(df), size=len(df))
+    weights = np.bincount(idx, minlength=len(df))
+
+    for n_neighbors, caliper in [(1, None), (3, None), (2, 0.005)]:
+        np.testing.assert_allclose(
+            ps_matching_estimator(
+                df, weights=weights, n_neighbors=n_neighbors, caliper=caliper
+            ),
+            ps_matching_estimator(
+                df.take(idx), n_neighbors=n_neighbors, caliper=caliper
+            ),
+            rtol=1e-9,
+        )
+
+
+def test_match_outcomes_ties_neighbors_and_caliper():
+    score = np.array([0.25, 0.25, 0.5, 1.0])
+    outcome = np.array([1.0, 3.0, 10.0, 20.0])
+    weight = np.ones(4)
+    query = np.array([0.25, 0.375, 0.5, 0.75, 0.875])
+
+    # identical scores are averaged; equidistant groups are taken together
+    np.testing.assert_allclose(
+        _match_outcomes(query, score, outcome, weight),
+        [2, 14 / 3, 10, (10 + 20) / 2, 20],
+    )
+    # a group taken in part contributes its mean outcome
+    np.testing.assert_allclose(
+        _match_outcomes(query, score, outcome, weight, n_neighbors=2),
+        [2, 14 / 3, 6, (10 + 20) / 2, (20 + 10) / 2],
+    )
+    # no neighbor within the caliper gives NaN
+    np.testing.assert_allclose(
+        _match_outcomes(query, score, outcome, weight, n_neighbors=2, caliper=0.2),
+        [2, 14 / 3, 10, np.nan, 20],
+    )
+    # a unit of weight w counts as w neighbors; weight 0 drops it
+    np.testing.assert_allclose(
+        _match_outcomes(query, score, outcome, np.array([2.0, 0, 1, 1]), n_neighbors=2),
+        _match_outcomes(
+            query, np.array([0.25, 0.25, 0.5, 1.0]), np.array([1.0, 1, 10, 20]), weight,
+            n_neighbors=2,
+        ),
+    )
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from climate_exposure import flag_heat_events, read_climate_files
+
+
+def test_read_climate_files_promotes_types_across_files(tmp_path):
+    for year, dtype in [(2010, np.float32), (2011, np.float64)]:
+        pd.DataFrame(
+            {
+                "date": pd.date_range(f"{year}-01-01", periods=3),
+                "code_muni": "1100015",
+                "TMAX_max": np.array([29.5, 31.0, 32.5], dtype=dtype),
+            }
+        ).to_parquet(tmp_path / f"{year}.parquet", index=False)
+
+    df = read_climate_files(tmp_path, ["date", "code_muni", "TMAX_max"], 2)
+
+    assert len(df) == 6
+    assert df["TMAX_max"].dtype == np.float64
+    assert df["date"].is_monotonic_increasing
+
+
+def legacy_flag_heat_event(
+    group, window_size, temperature_threshold, min_days, date_col, city_col, temperature_col
+):
+    """
+    The per-municipality rolling count that flag_heat_events replaced.
+    """
+
+    group = group.sort_values(date_col).copy()
+    group["heat"] = group[temperature_col] > temperature_threshold
+    group["n_hot_days_last_X"] = (
+        group["heat"].shift(1).rolling(window=window_size, min_periods=1).sum()
+    )
+    group["heat_event"] = group["n_hot_days_last_X"] >= min_days
+
+    return group[[city_col, date_col, temperature_col, "heat_event"]]
+
+
+@pytest.mark.parametrize("window_size, min_days", [(3, 2), (7, 1), (40, 5), (40, 0)])
+def test_flag_heat_events_matches_legacy_rolling_count(window_size, min_days):
+    rng = np.random.default_rng(window_size + min_days)
+    blocks = []
+    for city in range(6):
+        # 1 to 30 days per municipality, with gaps in the dates
+        days = np.sort(rng.choice(60, size=rng.integers(1, 31), replace=False))
+        temperature = rng.normal(30, 3, len(days))
+        temperature[rng.random(len(days)) < 0.1] = np.nan
+        blocks.append(
+            pd.DataFrame(
+                {
+                    "code_muni": f"11000{city}",
+                    "date": pd.Timestamp("2020-01-01") + pd.to_timedelta(days, "D"),
+                    "TMAX_max": temperature,
+                }
+            )
+        )
+    df = pd.concat(blocks).sample(frac=1, random_state=1)
+
+    args = (window_size, 31.0, min_days, "date", "code_muni", "TMAX_max")
+    expected = (
+        pd.concat(
+            legacy_flag_heat_event(group, *args)
+            for _, group in df.groupby("code_muni", sort=False)
+        )
+        .sort_values(["code_muni", "date"], ignore_index=True)
+    )
+    result = flag_heat_events(df, *args)
+
+    pd.testing.assert_frame_equal(
+        result[["code_muni", "date", "TMAX_max", "heat_event"]].reset_index(drop=True),
+        expected,
+    )
+    # no event on the first day of a municipality
+    assert not result.groupby("code_muni")["heat_event"].first().any()
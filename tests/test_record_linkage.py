@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+from record_linkage import (
+    greedy_one_to_one,
+    optimal_one_to_one,
+    probabilistic_candidate_pairs,
+)
+
+
+def legacy_greedy_one_to_one(df_join):
+    """
+    The iterrows matcher that greedy_one_to_one replaced.
+    """
+
+    df_matches = (
+        df_join
+        .groupby("id_sim")
+        .agg(sinasc_list=("id_sinasc", lambda x: sorted(x.dropna().tolist())))
+        .sort_values("id_sim")
+        .reset_index()
+    )
+
+    id_sim_match = []
+    id_sinasc_match = []
+
+    for _, row in df_matches.iterrows():
+        available_matches = sorted(
+            set(row["sinasc_list"]) - set(id_sinasc_match)
+        )
+
+        if not available_matches:
+            continue
+
+        id_sim_match.append(int(row["id_sim"]))
+        id_sinasc_match.append(available_matches[0])
+
+    return pd.DataFrame({"id_sim": id_sim_match, "id_sinasc": id_sinasc_match})
+
+
+def test_greedy_one_to_one_fixed_pairs():
+    candidates = pd.DataFrame(
+        {
+            "id_sim": [3, 1, 1, 2, 2, 4, 3, 1],
+            "id_sinasc": [10, 10, 11, 10, 11, 12, 12, 10],
+        }
+    )
+
+    expected = pd.DataFrame({"id_sim": [1, 2, 3], "id_sinasc": [10, 11, 12]})
+
+    result = greedy_one_to_one(candidates)
+
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+    pd.testing.assert_frame_equal(
+        result, legacy_greedy_one_to_one(candidates), check_dtype=False
+    )
+
+
+def test_greedy_one_to_one_matches_legacy_loop():
+    rng = np.random.default_rng(13)
+    candidates = pd.DataFrame(
+        {
+            "id_sim": rng.integers(0, 300, 2_000),
+            "id_sinasc": rng.integers(0, 200, 2_000),
+        }
+    )
+
+    pd.testing.assert_frame_equal(
+        greedy_one_to_one(candidates),
+        legacy_greedy_one_to_one(candidates),
+        check_dtype=False,
+    )
+
+
+def test_probabilistic_candidate_pairs_with_missing_keys():
+    # Linkage keys as read by aux_functions.read_health_parquet:
+    # nullable small integers, with unparsable codes stored as <NA>
+    births = pd.DataFrame(
+        {
+            "id_sinasc": [0, 1, 2],
+            "CODMUNNASC": pd.array([110001, 110001, 110001], dtype="Int32"),
+            "DTNASC": pd.to_datetime(["2020-01-06", "2020-01-07", "2020-01-08"]),
+            "IDADEMAE": pd.array([25, 30, None], dtype="Int16"),
+            "RACACOR": pd.array([1, None, 4], dtype="Int8"),
+            "SEXO": pd.array([1, 2, None], dtype="Int8"),
+        }
+    )
+    deaths = (
+        births.drop(columns="id_sinasc")
+        .assign(RACACOR=pd.array([1, 2, None], dtype="Int8"))
+        .reset_index(names="id_sim")
+    )
+    compare_on = ["IDADEMAE", "RACACOR", "SEXO"]
+
+    pairs = probabilistic_candidate_pairs(
+        [births], deaths, compare_on, threshold=-np.inf
+    )
+    matches = optimal_one_to_one(pairs)
+
+    assert len(pairs) == 9
+    assert dict(zip(matches["id_sim"], matches["id_sinasc"])) == {0: 0, 1: 1}
+
+    # Missing fields count as disagreements
+    score = pairs.set_index(["id_sim", "id_sinasc"])["score"]
+    assert score[(0, 0)] > score[(1, 1)] > score[(2, 2)]